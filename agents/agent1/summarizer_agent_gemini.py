@@ -1,16 +1,31 @@
 # summarizer_agent_gemini.py
 import os
+import sys
+import re
+import json
 import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+# shared metrics middleware lives at the repo root, next to server.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from instrumentation import deadline_call, instrument_app, traced_call  # noqa: E402
+
 # Load environment variables from .env file
 load_dotenv()
 
 app = FastAPI(title="SummarizerAgent-Gemini")
 AGENT_NAME = "summarizer-gemini"
+METRICS = instrument_app(app, AGENT_NAME)
 
 # Initialize Gemini client.
 API_KEY = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
@@ -21,7 +36,44 @@ else:
     raise ValueError("GEMINI_API_KEY or GOOGLE_API_KEY environment variable is required")
 
 # Choose a model — using a model that's known to be available
-MODEL_NAME = "gemini-flash-latest" 
+MODEL_NAME = "gemini-flash-latest"
+# Built once and shared by every request
+MODEL = genai.GenerativeModel(MODEL_NAME)
+
+PROMPT_TEMPLATE = (
+    "Summarize the following text into a short, 2-4 bullet point summary. "
+    "Keep it factual and concise.\n\n"
+    "TEXT:\n{text}"
+)
+
+# Long-document (map-reduce) mode: texts above LONG_DOC_TOKENS are split into
+# chunks of at most CHUNK_TOKENS, summarized CHUNK_CONCURRENCY at a time, and the
+# partial summaries are reduced into one.
+LONG_DOC_TOKENS = int(os.environ.get("SUMMARIZER_LONG_DOC_TOKENS", "6000"))
+CHUNK_TOKENS = int(os.environ.get("SUMMARIZER_CHUNK_TOKENS", "2000"))
+CHUNK_CONCURRENCY = int(os.environ.get("SUMMARIZER_CHUNK_CONCURRENCY", "4"))
+
+CHUNK_PROMPT_TEMPLATE = (
+    "Summarize this section of a longer document into 2-4 factual bullet points. "
+    "Keep names, numbers and conclusions.\n\n"
+    "SECTION:\n{text}"
+)
+REDUCE_PROMPT_TEMPLATE = (
+    "The following bullet points summarize consecutive sections of one document. "
+    "Merge them into a short, 2-4 bullet point summary of the whole document. "
+    "Keep it factual and concise.\n\n"
+    "SECTION SUMMARIES:\n{text}"
+)
+
+# Summary cache settings (SUMMARY_CACHE_DIR enables the on-disk tier)
+CACHE_MAX_ENTRIES = int(os.environ.get("SUMMARY_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.environ.get("SUMMARY_CACHE_TTL", "3600"))  # seconds
+CACHE_DIR = os.environ.get("SUMMARY_CACHE_DIR")
+
+# Upstream concurrency: at most MAX_CONCURRENCY model calls in flight, at most
+# MAX_QUEUE more waiting for a slot; beyond that requests are rejected with 503.
+MAX_CONCURRENCY = int(os.environ.get("SUMMARIZER_MAX_CONCURRENCY", "8"))
+MAX_QUEUE = int(os.environ.get("SUMMARIZER_MAX_QUEUE", "64"))
 
 class CallIn(BaseModel):
     input: dict
@@ -32,33 +84,320 @@ class CallOut(BaseModel):
     result: dict
     meta: dict = {}
 
+
+class SummaryCache:
+    """
+    Content-addressed summary cache: a size-bounded LRU in memory with a TTL,
+    optionally backed by one JSON file per key under `directory` so entries
+    survive restarts. Safe to use from the FastAPI threadpool.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                if now - hit[0] < self.ttl:
+                    self._mem.move_to_end(key)
+                    return hit[1]
+                del self._mem[key]
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - entry["ts"] >= self.ttl:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            return None
+        self._remember(key, entry["ts"], entry["summary"])
+        return entry["summary"]
+
+    def put(self, key: str, summary: str) -> None:
+        ts = time.time()
+        self._remember(key, ts, summary)
+        if self.directory:
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"ts": ts, "summary": summary}, f)
+            os.replace(tmp, self._path(key))
+
+    def _remember(self, key: str, ts: float, summary: str) -> None:
+        with self._lock:
+            self._mem[key] = (ts, summary)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+
+class LeaderCancelled(RuntimeError):
+    """The request computing a coalesced summary was cancelled; a waiter takes over."""
+
+
+CACHE = SummaryCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_DIR)
+# key -> Future for summaries currently being generated (request coalescing)
+_INFLIGHT: Dict[str, asyncio.Future] = {}
+UPSTREAM_SLOTS = asyncio.Semaphore(MAX_CONCURRENCY)
+UPSTREAM_STATS = {"in_flight": 0, "queued": 0}
+
+
+def cache_key(text: str, template: str = PROMPT_TEMPLATE) -> str:
+    """Hash of whitespace-normalized text, the prompt template and the model name."""
+    normalized = re.sub(r"\s+", " ", text).strip()
+    digest = hashlib.sha256()
+    for part in (MODEL_NAME, template, normalized):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+async def generate_summary(prompt: str) -> str:
+    """Single upstream model call; tests replace this to run offline."""
+    response = await MODEL.generate_content_async(prompt)
+    return response.text if response and hasattr(response, 'text') else "Failed to generate summary"
+
+
+async def stream_summary(prompt: str) -> AsyncIterator[str]:
+    """Streaming upstream call yielding text pieces as the model produces them."""
+    response = await MODEL.generate_content_async(prompt, stream=True)
+    async for piece in response:
+        if getattr(piece, "text", None):
+            yield piece.text
+
+
+@asynccontextmanager
+async def upstream_slot():
+    """
+    Hold one of MAX_CONCURRENCY upstream slots; 503 if MAX_QUEUE callers already wait.
+    Records queue wait, upstream call time and outcome in METRICS.
+    """
+    if UPSTREAM_SLOTS.locked() and UPSTREAM_STATS["queued"] >= MAX_QUEUE:
+        METRICS.inc("upstream_calls_total", outcome="rejected")
+        raise HTTPException(status_code=503, detail="summarizer is overloaded, retry later")
+    UPSTREAM_STATS["queued"] += 1
+    queued_at = time.perf_counter()
+    try:
+        await UPSTREAM_SLOTS.acquire()
+    finally:
+        UPSTREAM_STATS["queued"] -= 1
+    started = time.perf_counter()
+    METRICS.observe("upstream_queue_wait_ms", (started - queued_at) * 1000)
+    UPSTREAM_STATS["in_flight"] += 1
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    except (asyncio.CancelledError, TimeoutError):
+        outcome = "cancelled"  # caller's deadline passed or it hung up
+        raise
+    finally:
+        UPSTREAM_STATS["in_flight"] -= 1
+        UPSTREAM_SLOTS.release()
+        METRICS.inc("upstream_calls_total", outcome=outcome)
+        METRICS.observe("upstream_duration_ms", (time.perf_counter() - started) * 1000, outcome=outcome)
+
+
+async def call_model(prompt: str) -> str:
+    """Run generate_summary under the upstream concurrency limit and bounded queue."""
+    async with upstream_slot():
+        return await generate_summary(prompt)
+
+
+async def summarize_cached(text: str, template: str = PROMPT_TEMPLATE) -> Tuple[str, str]:
+    """
+    Return (summary, cache_status) where cache_status is "hit", "miss" or
+    "coalesced". Concurrent requests for the same text share one upstream call.
+    """
+    key = cache_key(text, template)
+    summary = CACHE.get(key)
+    if summary is not None:
+        return summary, "hit"
+
+    # a leader whose caller went away (deadline, disconnect) hands over to a waiter
+    while (pending := _INFLIGHT.get(key)) is not None:
+        try:
+            return await asyncio.shield(pending), "coalesced"
+        except LeaderCancelled:
+            continue
+
+    pending = _INFLIGHT[key] = asyncio.get_running_loop().create_future()
+    try:
+        summary = (await call_model(template.format(text=text))).strip()
+        CACHE.put(key, summary)
+        pending.set_result(summary)
+        return summary, "miss"
+    except BaseException as e:
+        pending.set_exception(e if isinstance(e, Exception) else LeaderCancelled())
+        pending.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _INFLIGHT.pop(key, None)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4/3 tokens per word); no tokenizer round trip needed."""
+    return (len(text.split()) * 4 + 2) // 3
+
+
+def split_chunks(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """
+    Split text into chunks of at most `max_tokens`, on paragraph boundaries
+    where possible. Besides the size limit, a chunk also ends after any
+    paragraph whose hash picks it as a boundary (once the chunk is at least a
+    quarter full), so boundaries depend on content rather than on position:
+    editing one paragraph changes only its own chunk, not every chunk after it.
+    """
+    paragraphs: List[str] = []
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        words = para.split()
+        if estimate_tokens(para) <= max_tokens:
+            paragraphs.append(para)
+            continue
+        # oversized paragraph: cut it into word windows
+        step = max(1, max_tokens * 3 // 4)
+        paragraphs.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for para in paragraphs:
+        tokens = estimate_tokens(para)
+        if current and size + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(para)
+        size += tokens
+        boundary = hashlib.sha256(para.encode("utf-8")).digest()[0] % 4 == 0
+        if boundary and size >= max_tokens // 4:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+async def summarize_long(text: str) -> Tuple[str, Dict[str, int], int]:
+    """
+    Map-reduce summary of a long document. Chunks are summarized concurrently
+    (at most CHUNK_CONCURRENCY at a time) through the per-chunk cache, then the
+    partial summaries are merged, recursively if they are still too long.
+    Returns (summary, cache status counts, number of chunks).
+    """
+    chunks = split_chunks(text)
+    slots = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    counts: Dict[str, int] = {}
+
+    async def summarize_part(part: str, template: str) -> str:
+        async with slots:
+            summary, status = await summarize_cached(part, template)
+        counts[status] = counts.get(status, 0) + 1
+        return summary
+
+    partials = await asyncio.gather(*(summarize_part(c, CHUNK_PROMPT_TEMPLATE) for c in chunks))
+    for _ in range(8):  # each round shrinks the input; the cap only guards against a model that doesn't
+        if len(partials) == 1 and estimate_tokens(partials[0]) <= CHUNK_TOKENS:
+            break
+        groups = split_chunks("\n\n".join(partials))
+        partials = await asyncio.gather(*(summarize_part(g, REDUCE_PROMPT_TEMPLATE) for g in groups))
+        if len(groups) == 1:
+            break
+    return "\n".join(partials), counts, len(chunks)
+
+
+async def before_deadline(deadline: Optional[float], awaitable):
+    """Await `awaitable`, raising TimeoutError once the absolute `deadline` (epoch seconds) passes."""
+    async with asyncio.timeout(None if deadline is None else deadline - time.time()):
+        return await awaitable
+
+
+async def summary_lines(text: str, long_doc: bool, deadline: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    NDJSON body for streaming mode: {"delta": "..."} lines as text arrives, then
+    {"end": {"summary": ..., "cache": ...}}. Cached summaries, and long documents
+    (whose map step must finish before the reduce), arrive as a single delta.
+    @deadline_call only covers building the response, so the hub's
+    meta.deadline is enforced here: each model await is bounded by it, never
+    a yield (that would cancel the response writer instead).
+    """
+    try:
+        if long_doc:
+            summary, counts, n_chunks = await before_deadline(deadline, summarize_long(text))
+            yield json.dumps({"delta": summary}) + "\n"
+            yield json.dumps({"end": {"summary": summary, "chunks": n_chunks, "cache": counts}}) + "\n"
+            return
+        key = cache_key(text)
+        cached = CACHE.get(key)
+        if cached is not None:
+            yield json.dumps({"delta": cached}) + "\n"
+            yield json.dumps({"end": {"summary": cached, "cache": "hit"}}) + "\n"
+            return
+        pieces: List[str] = []
+        async with upstream_slot():
+            stream = stream_summary(PROMPT_TEMPLATE.format(text=text))
+            try:
+                while (piece := await before_deadline(deadline, anext(stream, None))) is not None:
+                    pieces.append(piece)
+                    yield json.dumps({"delta": piece}) + "\n"
+            finally:
+                await stream.aclose()
+        summary = "".join(pieces).strip()
+        CACHE.put(key, summary)
+        yield json.dumps({"end": {"summary": summary, "cache": "miss"}}) + "\n"
+    except HTTPException as e:
+        yield json.dumps({"error": e.detail}) + "\n"
+    except TimeoutError:
+        yield json.dumps({"error": "deadline exceeded"}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": f"Gemini request failed: {str(e)}"}) + "\n"
+
+
 @app.get("/health")
 def health():
-    return {"status": "ok", "agent": AGENT_NAME, "ts": time.time()}
+    return {"status": "ok", "agent": AGENT_NAME, "ts": time.time(), **UPSTREAM_STATS}
 
 @app.post("/call")
-def call(payload: CallIn):
+@traced_call
+@deadline_call
+async def call(payload: CallIn):
     text = payload.input.get("text", "")
     if not text or not text.strip():
         raise HTTPException(status_code=400, detail="text is required in input.text")
 
-    
-    prompt = (
-        "Summarize the following text into a short, 2-4 bullet point summary. "
-        "Keep it factual and concise.\n\n"
-        f"TEXT:\n{text}"
-    )
+    # input.mode: "auto" (default) picks map-reduce for long texts; "long" forces it; "short" disables it
+    mode = payload.input.get("mode", "auto")
+    long_doc = mode == "long" or (mode == "auto" and estimate_tokens(text) > LONG_DOC_TOKENS)
+    if payload.input.get("stream"):
+        return StreamingResponse(summary_lines(text, long_doc, payload.meta.get("deadline")),
+                                 media_type="application/x-ndjson")
 
     try:
-        # Create the model
-        model = genai.GenerativeModel(MODEL_NAME)
-        
-        # Generate content
-        response = model.generate_content(prompt)
-        
-        # Extract the text from the response
-        summary_text = response.text if response and hasattr(response, 'text') else "Failed to generate summary"
+        if long_doc:
+            summary_text, counts, n_chunks = await summarize_long(text)
+            return CallOut(status="ok", result={"summary": summary_text, "chunks": n_chunks},
+                           meta={"agent": AGENT_NAME, "cache": counts})
+        summary_text, cache_status = await summarize_cached(text)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini request failed: {str(e)}")
 
-    return CallOut(status="ok", result={"summary": summary_text.strip()}, meta={"agent": AGENT_NAME})
\ No newline at end of file
+    return CallOut(status="ok", result={"summary": summary_text}, meta={"agent": AGENT_NAME, "cache": cache_status})
@@ -1,11 +1,19 @@
 
+import os
+import sys
 import time
+import numpy as np
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List
+
+# shared metrics middleware lives at the repo root, next to server.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from instrumentation import deadline_call, instrument_app, traced_call  # noqa: E402
 
 app = FastAPI(title="MathAgent")
 AGENT_NAME = "math-agent"
+METRICS = instrument_app(app, AGENT_NAME, query_field="operation")
 
 class CallIn(BaseModel):
     input: Dict[str, Any]
@@ -20,7 +28,138 @@ class CallOut(BaseModel):
 def health():
     return {"status": "ok", "agent": AGENT_NAME, "ts": time.time()}
 
+# ---- Vectorized helpers ----
+# Binary operations accept scalars or equal-length arrays for their operands.
+BINARY_OPS = {
+    "add": ("a", "b", 0, 0),
+    "sub": ("a", "b", 0, 0),
+    "mul": ("a", "b", 0, 0),
+    "div": ("a", "b", 0, 1),
+    "percent": ("part", "total", 0, 0),
+}
+AGGREGATE_OPS = {"avg", "sum", "min", "max", "var", "std", "median", "percentile", "dot"}
+
+
+def as_array(value: Any, name: str) -> np.ndarray:
+    arr = np.asarray(value, dtype=float)
+    if arr.ndim > 1:
+        raise HTTPException(status_code=400, detail=f"{name} must be a scalar or a flat list")
+    # asarray turns null into NaN and "inf" into inf; neither can be answered in JSON
+    if not np.all(np.isfinite(arr)):
+        raise HTTPException(status_code=400, detail=f"{name} must contain finite numbers only")
+    return arr
+
+
+def check_finite(result: Any) -> Any:
+    """400 for a result that overflowed to inf (or became NaN), which JSON can't encode."""
+    if not np.all(np.isfinite(result)):
+        raise HTTPException(status_code=400, detail="result is not a finite number (overflow)")
+    return result
+
+
+def apply_binary(op: str, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Evaluate one binary operation elementwise; raises 400 on a zero divisor."""
+    if op == "add":
+        return x + y
+    if op == "sub":
+        return x - y
+    if op == "mul":
+        return x * y
+    if op == "div":
+        if np.any(y == 0):
+            raise HTTPException(status_code=400, detail="division by zero")
+        return x / y
+    # percent: x = part, y = total
+    if np.any(y == 0):
+        raise HTTPException(status_code=400, detail="total cannot be zero")
+    return (x / y) * 100
+
+
+def to_result(arr: np.ndarray) -> Dict[str, Any]:
+    """Scalars come back as {"value": v}, arrays as {"values": [...]}."""
+    check_finite(arr)
+    if arr.ndim == 0:
+        return {"value": float(arr)}
+    return {"values": arr.tolist()}
+
+
+def aggregate(op: str, inp: Dict[str, Any]) -> Any:
+    """Aggregates over input.values (dot also takes input.other)."""
+    arr = inp.get("values", [])
+    if not isinstance(arr, list) or len(arr) == 0:
+        raise HTTPException(status_code=400, detail="values must be a non-empty list")
+    vals = as_array(arr, "values")
+    if op == "avg":
+        return float(vals.mean())
+    if op == "sum":
+        return float(vals.sum())
+    if op == "min":
+        return float(vals.min())
+    if op == "max":
+        return float(vals.max())
+    if op == "var":
+        return float(vals.var(ddof=int(inp.get("ddof", 0))))
+    if op == "std":
+        return float(vals.std(ddof=int(inp.get("ddof", 0))))
+    if op == "median":
+        return float(np.median(vals))
+    if op == "percentile":
+        q = inp.get("q", 50)
+        pct = np.percentile(vals, as_array(q, "q"))
+        return pct.tolist() if np.ndim(pct) else float(pct)
+    # dot
+    other = inp.get("other")
+    if not isinstance(other, list) or len(other) != len(arr):
+        raise HTTPException(status_code=400, detail="other must be a list the same length as values")
+    return float(np.dot(vals, as_array(other, "other")))
+
+
+def run_batch(records: List[Any]) -> Dict[str, Any]:
+    """
+    Evaluate a list of binary operation records in one pass.
+    Records are grouped by operation and each group is computed as one NumPy
+    expression; results are returned in input order. A record that fails
+    yields None and an entry in "errors" instead of failing the whole batch.
+    """
+    values: List[Optional[float]] = [None] * len(records)
+    errors: Dict[int, str] = {}
+    groups: Dict[str, List[int]] = {}
+    for i, rec in enumerate(records):
+        op = rec.get("operation") if isinstance(rec, dict) else None
+        if op not in BINARY_OPS:
+            errors[i] = f"unsupported operation: {op}"
+            continue
+        groups.setdefault(op, []).append(i)
+
+    for op, idx in groups.items():
+        xk, yk, xd, yd = BINARY_OPS[op]
+        rows, xs, ys = [], [], []
+        for i in idx:
+            try:
+                x, y = float(records[i].get(xk, xd)), float(records[i].get(yk, yd))
+            except (TypeError, ValueError):
+                errors[i] = "numeric values required for operation"
+                continue
+            if not (np.isfinite(x) and np.isfinite(y)):
+                errors[i] = "finite numbers required for operation"
+                continue
+            if y == 0 and op in ("div", "percent"):
+                errors[i] = "division by zero" if op == "div" else "total cannot be zero"
+                continue
+            rows.append(i); xs.append(x); ys.append(y)
+        if rows:
+            out = apply_binary(op, np.array(xs), np.array(ys)).tolist()
+            for i, v in zip(rows, out):
+                if np.isfinite(v):
+                    values[i] = v
+                else:
+                    errors[i] = "result is not a finite number (overflow)"
+    return {"values": values, "errors": {str(k): v for k, v in sorted(errors.items())}}
+
+
 @app.post("/call")
+@traced_call
+@deadline_call
 def call(payload: CallIn):
     inp = payload.input or {}
     op = inp.get("operation")
@@ -28,34 +167,21 @@ def call(payload: CallIn):
         raise HTTPException(status_code=400, detail="operation required in input.operation")
 
     try:
-        if op == "add":
-            a = float(inp.get("a", 0)); b = float(inp.get("b", 0))
-            return {"status":"ok", "result":{"value": a + b}, "meta":{"agent":AGENT_NAME}}
-        if op == "sub":
-            a = float(inp.get("a", 0)); b = float(inp.get("b", 0))
-            return {"status":"ok", "result":{"value": a - b}, "meta":{"agent":AGENT_NAME}}
-        if op == "mul":
-            a = float(inp.get("a", 0)); b = float(inp.get("b", 0))
-            return {"status":"ok", "result":{"value": a * b}, "meta":{"agent":AGENT_NAME}}
-        if op == "div":
-            a = float(inp.get("a", 0)); b = float(inp.get("b", 1))
-            if b == 0:
-                raise HTTPException(status_code=400, detail="division by zero")
-            return {"status":"ok", "result":{"value": a / b}, "meta":{"agent":AGENT_NAME}}
-        if op == "percent":
-            total = float(inp.get("total", 0)); part = float(inp.get("part", 0))
-            if total == 0:
-                raise HTTPException(status_code=400, detail="total cannot be zero")
-            pct = (part / total) * 100
-            return {"status":"ok", "result":{"value": pct}, "meta":{"agent":AGENT_NAME}}
-        if op == "avg":
-            arr = inp.get("values", [])
-            if not isinstance(arr, list) or len(arr) == 0:
-                raise HTTPException(status_code=400, detail="values must be a non-empty list")
-            vals = [float(x) for x in arr]
-            return {"status":"ok", "result":{"value": sum(vals)/len(vals)}, "meta":{"agent":AGENT_NAME}}
-
-       
+        if op in BINARY_OPS:
+            # a/b (part/total) may be scalars or equal-length lists
+            xk, yk, xd, yd = BINARY_OPS[op]
+            x = as_array(inp.get(xk, xd), xk); y = as_array(inp.get(yk, yd), yk)
+            if x.ndim and y.ndim and x.shape != y.shape:
+                raise HTTPException(status_code=400, detail=f"{xk} and {yk} must have the same length")
+            return {"status":"ok", "result":to_result(apply_binary(op, x, y)), "meta":{"agent":AGENT_NAME}}
+        if op in AGGREGATE_OPS:
+            return {"status":"ok", "result":{"value": check_finite(aggregate(op, inp))}, "meta":{"agent":AGENT_NAME}}
+        if op == "batch":
+            records = inp.get("ops", [])
+            if not isinstance(records, list) or len(records) == 0:
+                raise HTTPException(status_code=400, detail="ops must be a non-empty list of operation records")
+            return {"status":"ok", "result":run_batch(records), "meta":{"agent":AGENT_NAME}}
+
         raise HTTPException(status_code=400, detail=f"unsupported operation: {op}")
-    except ValueError:
+    except (TypeError, ValueError):
         raise HTTPException(status_code=400, detail="numeric values required for operation")
@@ -1,17 +1,279 @@
 
+import json
+import os
+import sys
+import threading
 import time
+from collections.abc import MutableMapping
+from bisect import bisect_right
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# shared metrics middleware lives at the repo root, next to server.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from instrumentation import deadline_call, instrument_app, traced_call  # noqa: E402
+from user_index import UserIndex  # noqa: E402
 
 app = FastAPI(title="DataAgent")
 AGENT_NAME = "data-agent"
+METRICS = instrument_app(app, AGENT_NAME)
+
+SEED_USERS: List[Dict[str, Any]] = [
+    {"id": 1, "name": "Harshit", "role": "student", "email": "harshit@example.com"},
+    {"id": 2, "name": "Samrat", "role": "webdev", "email": "samrat@example.com"},
+    {"id": 3, "name": "Aisha",  "role": "ml", "email": "aisha@example.com"}
+]
+
+# ---- Storage engine ----
+# DATA_AGENT_STORE=memory keeps users in process only; DATA_AGENT_STORE=log also
+# appends every write to DATA_AGENT_DIR/users.log and periodically folds the log
+# into DATA_AGENT_DIR/users.snapshot, so a restart recovers by loading the
+# snapshot and replaying the (short) log tail.
+STORE_KIND = os.environ.get("DATA_AGENT_STORE", "memory")
+DATA_DIR = os.environ.get("DATA_AGENT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+# compact once the log holds this many entries AND at least as many as there are
+# records, so snapshot cost stays amortized O(1) per write however large the store
+COMPACT_EVERY = int(os.environ.get("DATA_AGENT_COMPACT_EVERY", "10000"))
+FSYNC_WRITES = os.environ.get("DATA_AGENT_FSYNC", "0") == "1"
+
+CORE_FIELDS = ("name", "role", "email")
+_MISSING = object()
+
+
+class UserRecord:
+    """
+    Resident form of one user. The common fields live in slots (no per-record
+    __dict__), roles are interned, and only unusual fields go to `extra`.
+    """
+    __slots__ = ("id", "name", "role", "email", "extra")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.id = int(data["id"])
+        self.extra = None
+        for key, value in data.items():
+            if key == "id":
+                continue
+            if key in CORE_FIELDS:
+                if key == "role" and isinstance(value, str):
+                    value = sys.intern(value)
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"id": self.id}
+        for key in CORE_FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                out[key] = value
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+
+class MemoryStore(MutableMapping):
+    """id -> user mapping backed by UserRecord objects; reads return plain dicts."""
+
+    def __init__(self):
+        self._records: Dict[int, UserRecord] = {}
+
+    def __getitem__(self, uid: int) -> Dict[str, Any]:
+        return self._records[uid].to_dict()
+
+    def __setitem__(self, uid: int, data: Dict[str, Any]) -> None:
+        self._records[uid] = UserRecord(dict(data, id=uid))
+
+    def __delitem__(self, uid: int) -> None:
+        del self._records[uid]
+
+    def __contains__(self, uid: object) -> bool:
+        return uid in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+class LogStore(MemoryStore):
+    """
+    MemoryStore plus an append-only log and snapshot for crash/restart recovery.
+    /call runs on the threadpool, so writes and log rotation hold `_lock`.
+    Compaction rotates users.log to users.log.1 under the lock and writes the
+    snapshot on a background thread; recovery replays snapshot, .1, then log.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__()
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, "users.snapshot")
+        self.log_path = os.path.join(directory, "users.log")
+        self.rotated_path = self.log_path + ".1"
+        self._lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+        self._recover()
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        if os.path.exists(self.rotated_path):
+            # crashed mid-compaction: finish it before taking writes
+            self._rotate()
+            self._compactor.join()
+
+    def _replay(self, path: str) -> int:
+        """Apply a log file; returns the byte offset just past its last intact entry."""
+        good = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("torn write")
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn final write from a crash; everything before it is intact
+                if entry["op"] == "put":
+                    rec = UserRecord(entry["data"])
+                    self._records[rec.id] = rec
+                elif entry["op"] == "del":
+                    self._records.pop(entry["id"], None)
+                self._log_entries += 1
+                good += len(line)
+        return good
+
+    def _recover(self) -> None:
+        self._log_entries = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                for line in f:
+                    rec = UserRecord(json.loads(line))
+                    self._records[rec.id] = rec
+        if os.path.exists(self.rotated_path):
+            self._replay(self.rotated_path)
+        if os.path.exists(self.log_path):
+            good = self._replay(self.log_path)
+            if good < os.path.getsize(self.log_path):
+                # cut the torn tail so the next append starts on a fresh line
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(good)
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        # caller holds self._lock
+        self._log.write(json.dumps(entry) + "\n")
+        self._log.flush()
+        if FSYNC_WRITES:
+            os.fsync(self._log.fileno())
+        self._log_entries += 1
+        if self._log_entries >= max(COMPACT_EVERY, len(self._records)) and not self._compacting():
+            self._rotate()
+
+    def __setitem__(self, uid: int, data: Dict[str, Any]) -> None:
+        with self._lock:
+            super().__setitem__(uid, data)
+            self._append({"op": "put", "data": self._records[uid].to_dict()})
+
+    def __delitem__(self, uid: int) -> None:
+        with self._lock:
+            super().__delitem__(uid)
+            self._append({"op": "del", "id": uid})
+
+    def _compacting(self) -> bool:
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def _rotate(self) -> None:
+        """Start a fresh log and snapshot the records as of now on a background thread."""
+        # records are replaced, never mutated, so a shallow copy is a consistent view
+        records = list(self._records.values())
+        self._log.close()
+        if os.path.exists(self.rotated_path):
+            # .1 from a failed compaction is still pending: keep this log as well,
+            # replaying it over the new snapshot is harmless
+            self._log = open(self.log_path, "a", encoding="utf-8")
+        else:
+            os.replace(self.log_path, self.rotated_path)
+            self._log = open(self.log_path, "w", encoding="utf-8")
+        self._log_entries = 0
+        self._compactor = threading.Thread(target=self._write_snapshot, args=(records,), daemon=True)
+        self._compactor.start()
+
+    def _write_snapshot(self, records: List[UserRecord]) -> None:
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec.to_dict()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        # replaying the rotated log over the new snapshot is harmless, so a crash before this is safe
+        os.remove(self.rotated_path)
+
+    def compact(self) -> None:
+        """Fold everything logged so far into the snapshot and wait for it."""
+        with self._lock:
+            if self._compacting():
+                self._compactor.join()
+            self._rotate()
+            compactor = self._compactor
+        compactor.join()
+
+
+def open_store() -> MemoryStore:
+    store = LogStore(DATA_DIR) if STORE_KIND == "log" else MemoryStore()
+    if not len(store):
+        for user in SEED_USERS:
+            store[user["id"]] = user
+    return store
+
+
+DB: MemoryStore = open_store()
+
+# ---- Secondary indexes (role + name/email trigrams, maintained on insert) ----
+INDEX = UserIndex(DB)
+
+
+# ---- Pagination / streaming ----
+MAX_PAGE_SIZE = 1000
+
+
+def page_params(inp: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+    """Parse input.limit / input.cursor; the cursor is the last id of the previous page."""
+    limit, cursor = inp.get("limit"), inp.get("cursor")
+    try:
+        limit = int(limit) if limit is not None else None
+        cursor = int(cursor) if cursor not in (None, "") else None
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="limit and cursor must be integers")
+    if limit is not None and not 0 < limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit, cursor
+
+
+def paginate(ids: List[int], limit: Optional[int], cursor: Optional[int]) -> Tuple[List[int], Optional[str]]:
+    """Slice an ascending id list after `cursor`; returns (page ids, next cursor or None)."""
+    start = bisect_right(ids, cursor) if cursor is not None else 0
+    end = len(ids) if limit is None else min(start + limit, len(ids))
+    next_cursor = str(ids[end - 1]) if end < len(ids) else None
+    return ids[start:end], next_cursor
+
 
-DB: Dict[int, Dict[str, Any]] = {
-    1: {"id": 1, "name": "Harshit", "role": "student", "email": "harshit@example.com"},
-    2: {"id": 2, "name": "Samrat", "role": "webdev", "email": "samrat@example.com"},
-    3: {"id": 3, "name": "Aisha",  "role": "ml", "email": "aisha@example.com"}
-}
+def respond_page(inp: Dict[str, Any], ids: List[int]):
+    """
+    Return one page of users as JSON, or as NDJSON when input.stream is true.
+    Streamed output is one {"data": user} line per record followed by a final
+    {"end": {"count": n, "next_cursor": ...}} line.
+    """
+    limit, cursor = page_params(inp)
+    page, next_cursor = paginate(ids, limit, cursor)
+    if inp.get("stream"):
+        def lines():
+            for uid in page:
+                yield json.dumps({"data": DB[uid]}) + "\n"
+            yield json.dumps({"end": {"count": len(page), "next_cursor": next_cursor}}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    return {"status":"ok", "result": {"data": [DB[uid] for uid in page], "next_cursor": next_cursor},
+            "meta": {"agent": AGENT_NAME}}
 
 class CallIn(BaseModel):
     input: Dict[str, Any]
@@ -22,6 +284,8 @@ def health():
     return {"status": "ok", "agent": AGENT_NAME, "ts": time.time(), "count": len(DB)}
 
 @app.post("/call")
+@traced_call
+@deadline_call
 def call(payload: CallIn):
     inp = payload.input or {}
     q = inp.get("query")
@@ -40,28 +304,28 @@ def call(payload: CallIn):
 
    
     if q == "list_users":
-        return {"status":"ok", "result": {"data": list(DB.values())}, "meta": {"agent": AGENT_NAME}}
+        return respond_page(inp, INDEX.ordered_ids)
 
     
     if q == "search":
         term = str(inp.get("term", "")).lower()
         by_role = inp.get("role")
-        results: List[Dict[str, Any]] = []
-        for u in DB.values():
-            if by_role and u.get("role") == by_role:
-                results.append(u)
-            elif term and (term in u.get("name","").lower() or term in u.get("email","").lower()):
-                results.append(u)
-        return {"status":"ok", "result": {"data": results}, "meta": {"agent": AGENT_NAME}}
+        ids: Set[int] = set()
+        if by_role:
+            ids |= INDEX.with_role(str(by_role))
+        if term:
+            ids |= INDEX.matching(term)
+        return respond_page(inp, sorted(ids))
 
    
     if q == "insert":
         payload_data = inp.get("data")
         if not isinstance(payload_data, dict):
             raise HTTPException(status_code=400, detail="data object required for insert")
-        new_id = max(DB.keys()) + 1 if DB else 1
-        payload_data["id"] = new_id
-        DB[new_id] = payload_data
+        try:
+            INDEX.insert(payload_data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         return {"status":"ok", "result": {"data": payload_data}, "meta":{"agent":AGENT_NAME}}
 
     raise HTTPException(status_code=400, detail="unknown query")
@@ -2,16 +2,109 @@
 import asyncio
 import time
 import os
+import sys
+from collections import deque
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import psutil 
 
-app = FastAPI(title="HealthAgent")
+# shared metrics middleware lives at the repo root, next to server.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from instrumentation import deadline_call, instrument_app, traced_call  # noqa: E402
+
 AGENT_NAME = "health-agent"
+STATE = {"status": "ok"}
 
+# Background sampler: one system/process sample every SAMPLE_INTERVAL seconds,
+# the last HISTORY_SIZE samples kept in a ring buffer.
+SAMPLE_INTERVAL = float(os.environ.get("HEALTH_SAMPLE_INTERVAL", "1.0"))
+HISTORY_SIZE = int(os.environ.get("HEALTH_HISTORY_SIZE", "900"))
+SAMPLES: deque = deque(maxlen=HISTORY_SIZE)
+NUMERIC_FIELDS = ("cpu", "memory", "disk", "net_sent_bps", "net_recv_bps",
+                  "proc_cpu", "proc_rss_mb", "proc_threads")
+_PROC = psutil.Process(os.getpid())
+_last_net: Optional[tuple] = None
+
+
+def take_sample() -> Dict[str, Any]:
+    """
+    Collect one sample without blocking: cpu_percent(interval=None) reports
+    usage since the previous call, so the sampler's cadence is the window.
+    """
+    global _last_net
+    now = time.time()
+    try:
+        net = psutil.net_io_counters()
+        sent_bps = recv_bps = 0.0
+        if _last_net is not None and now > _last_net[0]:
+            elapsed = now - _last_net[0]
+            sent_bps = (net.bytes_sent - _last_net[1]) / elapsed
+            recv_bps = (net.bytes_recv - _last_net[2]) / elapsed
+        _last_net = (now, net.bytes_sent, net.bytes_recv)
+        sample = {
+            "ts": now,
+            "cpu": psutil.cpu_percent(interval=None),
+            "memory": psutil.virtual_memory().percent,
+            "disk": psutil.disk_usage("/").percent,
+            "net_sent_bps": round(sent_bps, 1),
+            "net_recv_bps": round(recv_bps, 1),
+            "proc_cpu": _PROC.cpu_percent(interval=None),
+            "proc_rss_mb": round(_PROC.memory_info().rss / 2**20, 2),
+            "proc_threads": _PROC.num_threads(),
+        }
+    except Exception:
+        sample = {"ts": now, "cpu": 5.0, "memory": 30.0, "disk": 0.0, "net_sent_bps": 0.0,
+                  "net_recv_bps": 0.0, "proc_cpu": 0.0, "proc_rss_mb": 0.0, "proc_threads": 0}
+    SAMPLES.append(sample)
+    return sample
+
+
+async def sampler():
+    while True:
+        await asyncio.sleep(SAMPLE_INTERVAL)
+        take_sample()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the sampler for the app's lifetime; the task is kept so shutdown can cancel it."""
+    # prime the cpu_percent counters so the first sample covers a full interval
+    try:
+        psutil.cpu_percent(interval=None)
+        _PROC.cpu_percent(interval=None)
+    except Exception:
+        pass
+    task = asyncio.create_task(sampler())
+    try:
+        yield
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+app = FastAPI(title="HealthAgent", lifespan=lifespan)
+METRICS = instrument_app(app, AGENT_NAME, query_field="cmd")
 
-STATE = {"status": "ok"}
+
+def summarize_window(samples: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """min/avg/p95/max/last for every numeric field over the given samples."""
+    stats: Dict[str, Dict[str, float]] = {}
+    for field in NUMERIC_FIELDS:
+        values = sorted(s[field] for s in samples)
+        p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+        stats[field] = {
+            "min": values[0],
+            "avg": round(sum(values) / len(values), 2),
+            "p95": p95,
+            "max": values[-1],
+            "last": samples[-1][field],
+        }
+    return stats
 
 class CallIn(BaseModel):
     input: Dict[str, Any]
@@ -20,20 +113,36 @@ class CallIn(BaseModel):
 @app.get("/health")
 def health():
     """
-    Return health status and basic metrics.
-    Uses psutil if available, otherwise returns mocked CPU/memory.
+    Return health status and basic metrics from the latest background sample
+    (mocked values if psutil is unavailable). Never blocks on measurement.
     """
     status = STATE["status"]
-    
-    try:
-        cpu = f"{psutil.cpu_percent(interval=0.1)}%"
-        mem = f"{psutil.virtual_memory().percent}%"
-    except Exception:
-        cpu = "5%"
-        mem = "30%"
-    return {"status": status, "agent": AGENT_NAME, "ts": time.time(), "cpu": cpu, "memory": mem}
+    sample = SAMPLES[-1] if SAMPLES else take_sample()
+    return {"status": status, "agent": AGENT_NAME, "ts": time.time(),
+            "cpu": f"{sample['cpu']}%", "memory": f"{sample['memory']}%",
+            "disk": f"{sample['disk']}%", "sampled_at": sample["ts"]}
+
+@app.get("/history")
+def history(window: float = 60.0, series: bool = False):
+    """
+    Windowed statistics over the sampler's ring buffer.
+    `window` is in seconds; with series=true the raw samples are included too.
+    """
+    if window <= 0:
+        raise HTTPException(status_code=400, detail="window must be positive")
+    cutoff = time.time() - window
+    samples = [s for s in SAMPLES if s["ts"] >= cutoff]
+    if not samples:
+        raise HTTPException(status_code=404, detail="no samples in window")
+    out = {"status": "ok", "agent": AGENT_NAME, "window": window, "count": len(samples),
+           "interval": SAMPLE_INTERVAL, "stats": summarize_window(samples)}
+    if series:
+        out["series"] = samples
+    return out
 
 @app.post("/call")
+@traced_call
+@deadline_call
 def call(payload: CallIn):
     """
     Return a structured status object (MCP style).
@@ -0,0 +1,433 @@
+"""
+bench.py — load-testing harness for the hub and the agents under agents/.
+
+Boots the math, data, health and summarizer agents as local uvicorn
+processes, on the ports server.py expects. The summarizer runs with its model
+stubbed: generate_summary/stream_summary sleep BENCH_MODEL_MS and echo, so no
+Gemini key or network is needed. The hub (server.py) is started over stdio,
+the same transport an MCP client uses. The harness then drives load:
+
+  closed loop  N workers, each sending its next request as soon as the last returns
+  open loop    Poisson arrivals at R req/s, independent of how fast answers come
+               back; latency is measured from the scheduled send time, so a
+               stalled server is not hidden (no coordinated omission)
+
+Targets:
+  tool:call_agent_tool  tool:health_all  tool:summarize_with_gemini   (through the hub)
+  agent:math-agent  agent:data-agent  agent:health-agent  agent:summarizer-gemini   (direct /call)
+
+Results are written as JSON, one entry per (target, mode, level), with
+throughput, error rate and p50/p95/p99/p999 latency. Each file is tagged with
+the git commit, and `compare` diffs two result files.
+
+  python bench.py run                                   # every target, closed loop, 8 workers, 5 s
+  python bench.py run --targets agent:math-agent --mode open --rate 100,500 --duration 10
+  python bench.py run --targets tool:call_agent_tool --concurrency 1,8,32 --out before.json
+  python bench.py compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(ROOT, "bench_results")
+MODEL_MS = float(os.environ.get("BENCH_MODEL_MS", "50"))  # stubbed summarizer model latency
+STARTUP_TIMEOUT = 30.0
+MAX_OPEN_OUTSTANDING = 10000   # open loop gives up on a level past this many unanswered requests
+
+# agent -> (directory under agents/, module, port); ports match AGENTS in server.py
+BENCH_AGENTS: Dict[str, Tuple[str, str, int]] = {
+    "summarizer-gemini": ("agent1", "summarizer_agent_gemini", 8005),
+    "math-agent": ("agent2", "math_agent", 8003),
+    "data-agent": ("agent3", "data_agent", 8002),
+    "health-agent": ("agent4", "health_agent", 8004),
+}
+
+RUN_NONCE = f"{random.getrandbits(32):08x}"  # keeps summarizer inputs cold across runs
+
+SAMPLE_TEXT = ("The hub routes each request to an agent, retries on another replica when one "
+               "fails and records how long every hop took. ") * 8
+
+
+# ------------------------------------------------------------
+# Request generators: seq -> payload (seq varies inputs so caches don't answer everything)
+# ------------------------------------------------------------
+# `tag` names the run, target and level. Summarizer texts carry it, so no
+# target or level is answered from a summary cached by an earlier one.
+def agent_payload(agent: str, seq: int, tag: str = "") -> dict:
+    if agent == "math-agent":
+        op = ("add", "mul", "avg", "percent")[seq % 4]
+        return {"input": {"operation": op, "a": seq, "b": 3, "values": [seq, 2, 3, 4], "part": seq, "total": 1000}}
+    if agent == "data-agent":
+        if seq % 3 == 0:
+            return {"input": {"query": "search", "term": ("ha", "aisha", "webdev")[seq % 9 // 3]}}
+        return {"input": {"query": "get_user", "id": seq % 3 + 1}}
+    if agent == "health-agent":
+        return {"input": {"cmd": "status"}}
+    if agent == "summarizer-gemini":
+        return {"input": {"text": f"Request {tag} {seq}. {SAMPLE_TEXT}"}}
+    raise ValueError(agent)
+
+
+def tool_payload(tool: str, seq: int, use_cache: bool, tag: str = "") -> dict:
+    if tool == "call_agent_tool":
+        agent = ("math-agent", "data-agent")[seq % 2]
+        body = agent_payload(agent, seq)["input"]
+        query = body.pop("query", "calc")
+        payload = {"agent": agent, "query": query, "input": body}
+        if not use_cache:
+            payload["cache"] = False
+        return payload
+    if tool == "health_all":
+        return {}
+    if tool == "summarize_with_gemini":
+        return {"text": f"Request {tag} {seq}. {SAMPLE_TEXT}"}
+    raise ValueError(tool)
+
+
+def is_error(result: Any) -> bool:
+    """Hub and agent answers report failures as an "error" key, possibly one level down."""
+    if not isinstance(result, dict):
+        return False
+    if "error" in result:
+        return True
+    inner = result.get("result")
+    return isinstance(inner, dict) and "error" in inner
+
+
+# ------------------------------------------------------------
+# Process management
+# ------------------------------------------------------------
+def serve_agent(agent: str) -> None:
+    """Entry point of an agent subprocess (`bench.py serve-agent NAME`)."""
+    import uvicorn
+
+    directory, module_name, port = BENCH_AGENTS[agent]
+    sys.path.insert(0, os.path.join(ROOT, "agents", directory))
+    os.chdir(os.path.join(ROOT, "agents", directory))
+    module = __import__(module_name)
+    if agent == "summarizer-gemini":
+        async def fake_generate(prompt: str) -> str:
+            await asyncio.sleep(MODEL_MS / 1000)
+            return "Summary: " + prompt[-80:]
+
+        async def fake_stream(prompt: str):
+            for word in ("Summary:",) + tuple(prompt[-80:].split()):
+                await asyncio.sleep(MODEL_MS / 1000 / 10)
+                yield word + " "
+
+        module.generate_summary = fake_generate
+        module.stream_summary = fake_stream
+    uvicorn.run(module.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_agents(agents: List[str]) -> List[subprocess.Popen]:
+    env = {**os.environ, "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "bench-stub"),
+           "DATA_AGENT_STORE": os.environ.get("DATA_AGENT_STORE", "memory")}
+    return [subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve-agent", agent], env=env)
+            for agent in agents]
+
+
+async def wait_healthy(agents: List[str], timeout: float = STARTUP_TIMEOUT) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        for agent in agents:
+            url = f"http://127.0.0.1:{BENCH_AGENTS[agent][2]}/health"
+            while True:
+                try:
+                    if (await client.get(url)).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{agent} did not become healthy at {url}")
+                await asyncio.sleep(0.2)
+
+
+def stop_processes(procs: List[subprocess.Popen]) -> None:
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextlib.asynccontextmanager
+async def hub_session():
+    """fastmcp Client connected to a fresh server.py over stdio."""
+    from fastmcp import Client
+    from fastmcp.client.transports import StdioTransport
+
+    # import and run the module directly: server.py's __main__ banner would go to the stdio stream
+    transport = StdioTransport(command=sys.executable, args=["-c", "import server; server.mcp.run()"], cwd=ROOT)
+    async with Client(transport, timeout=60) as client:
+        # tools register under their function names (health_all_tool); map the short keys
+        registered = {tool.name for tool in await client.list_tools()}
+        client.tool_names = {name[:-len("_tool")]: name for name in registered if name.endswith("_tool")}
+        yield client
+
+
+# ------------------------------------------------------------
+# Load generation
+# ------------------------------------------------------------
+Sender = Callable[[int], Awaitable[bool]]  # seq -> True when the answer was an error
+
+
+async def closed_loop(send: Sender, concurrency: int, duration: float) -> Tuple[List[float], int, float]:
+    latencies: List[float] = []
+    errors = 0
+    seq = itertools.count()
+    stop_at = time.perf_counter() + duration
+
+    async def worker() -> None:
+        nonlocal errors
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                failed = await send(next(seq))
+            except Exception:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def open_loop(send: Sender, rate: float, duration: float) -> Tuple[List[float], int, float]:
+    latencies: List[float] = []
+    errors = 0
+    tasks = set()
+
+    async def one(seq: int, scheduled: float) -> None:
+        nonlocal errors
+        try:
+            failed = await send(seq)
+        except Exception:
+            failed = True
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+        errors += failed
+
+    started = time.perf_counter()
+    next_at = started
+    for seq in itertools.count():
+        next_at += random.expovariate(rate)
+        if next_at - started >= duration:
+            break
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= MAX_OPEN_OUTSTANDING:
+            errors += 1  # counted as dropped: the target can't keep up with this rate
+            continue
+        task = asyncio.ensure_future(one(seq, next_at))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+def summarize(target: str, mode: str, level: float, duration: float,
+              latencies: List[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    requests = max(len(latencies), errors)
+    return {
+        "target": target,
+        "mode": mode,
+        "concurrency" if mode == "closed" else "rate": level,
+        "duration_s": duration,
+        "requests": requests,
+        "errors": errors,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered), 3) if ordered else None,
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+            "p999": percentile(ordered, 0.999),
+            "max": round(ordered[-1], 3) if ordered else None,
+        },
+    }
+
+
+def make_sender(target: str, http: httpx.AsyncClient, hub, use_cache: bool, tag: str) -> Sender:
+    kind, name = target.split(":", 1)
+    if kind == "agent":
+        url = f"http://127.0.0.1:{BENCH_AGENTS[name][2]}/call"
+
+        async def send_agent(seq: int) -> bool:
+            resp = await http.post(url, json=agent_payload(name, seq, tag))
+            return resp.status_code >= 400 or is_error(resp.json())
+        return send_agent
+
+    async def send_tool(seq: int) -> bool:
+        result = await hub.call_tool(hub.tool_names.get(name, name),
+                                     {"payload": tool_payload(name, seq, use_cache, tag)}, raise_on_error=False)
+        if result.is_error:
+            return True
+        data = result.structured_content
+        if data is None and result.content:
+            data = json.loads(result.content[0].text)
+        return is_error(data)
+    return send_tool
+
+
+# ------------------------------------------------------------
+# Commands
+# ------------------------------------------------------------
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict:
+    targets = args.targets.split(",")
+    levels = [float(x) for x in (args.rate if args.mode == "open" else args.concurrency).split(",")]
+    needs_hub = any(t.startswith("tool:") for t in targets)
+    agents = list(BENCH_AGENTS) if needs_hub else [t.split(":", 1)[1] for t in targets]
+
+    procs = [] if args.no_boot else start_agents(agents)
+    results = []
+    try:
+        await wait_healthy(agents)
+        exited = [agent for agent, proc in zip(agents, procs) if proc.poll() is not None]
+        if exited:  # typically the port was taken by an agent that was already running
+            raise RuntimeError(f"agent process exited early: {', '.join(exited)} (use --no-boot to reuse running agents)")
+        limits = httpx.Limits(max_connections=512, max_keepalive_connections=512)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as http:
+            async with (hub_session() if needs_hub else contextlib.nullcontext()) as hub:
+                if hub is not None:
+                    # warm the health registry so health_all answers from it
+                    await hub.call_tool(hub.tool_names["health_all"], {"payload": {"fresh": True}})
+                for target in targets:
+                    for level in levels:
+                        send = make_sender(target, http, hub, args.cache, f"{RUN_NONCE}/{target}/{level:g}")
+                        for seq in range(args.warmup):
+                            await send(-1 - seq)
+                        if args.mode == "open":
+                            lat, errors, elapsed = await open_loop(send, level, args.duration)
+                        else:
+                            lat, errors, elapsed = await closed_loop(send, int(level), args.duration)
+                        entry = summarize(target, args.mode, level, args.duration, lat, errors, elapsed)
+                        results.append(entry)
+                        lm = entry["latency_ms"]
+                        print(f"{target:32} {args.mode:6} {level:>7g}  {entry['throughput_rps']:>9.1f} rps  "
+                              f"p50 {lm['p50']}  p99 {lm['p99']}  p999 {lm['p999']} ms  "
+                              f"errors {entry['error_rate']:.2%}", flush=True)
+    finally:
+        stop_processes(procs)
+
+    report = {
+        "commit": git_commit(),
+        "ts": time.time(),
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "config": {"mode": args.mode, "duration_s": args.duration, "warmup": args.warmup,
+                   "model_ms": MODEL_MS, "hub_cache": args.cache},
+        "results": results,
+    }
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"bench-{(report['commit'] or 'nogit')[:10]}-{int(report['ts'])}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {out}")
+    return report
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """Print throughput and tail-latency changes for scenarios present in both files."""
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)
+
+    def key(entry: dict) -> tuple:
+        return entry["target"], entry["mode"], entry.get("concurrency", entry.get("rate"))
+
+    old = {key(e): e for e in before["results"]}
+    print(f"{(before.get('commit') or '?')[:10]} -> {(after.get('commit') or '?')[:10]}")
+    for entry in after["results"]:
+        prev = old.get(key(entry))
+        if prev is None:
+            continue
+
+        def delta(a: Optional[float], b: Optional[float]) -> str:
+            if not a or b is None:
+                return "n/a"
+            return f"{(b - a) / a:+.1%}"
+
+        print(f"{entry['target']:32} {entry['mode']:6} {key(entry)[2]:>7g}  "
+              f"rps {delta(prev['throughput_rps'], entry['throughput_rps']):>8}  "
+              f"p50 {delta(prev['latency_ms']['p50'], entry['latency_ms']['p50']):>8}  "
+              f"p99 {delta(prev['latency_ms']['p99'], entry['latency_ms']['p99']):>8}  "
+              f"errors {prev['error_rate']:.2%} -> {entry['error_rate']:.2%}")
+
+
+def main() -> None:
+    all_targets = ["tool:call_agent_tool", "tool:health_all", "tool:summarize_with_gemini"] + \
+                  [f"agent:{a}" for a in BENCH_AGENTS]
+    parser = argparse.ArgumentParser(description="Benchmark the MCP hub and its agents")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="boot the agents and hub, drive load, write JSON results")
+    p_run.add_argument("--targets", default=",".join(all_targets), help="comma-separated, e.g. agent:math-agent")
+    p_run.add_argument("--mode", choices=["closed", "open"], default="closed")
+    p_run.add_argument("--concurrency", default="8", help="closed loop: comma-separated worker counts")
+    p_run.add_argument("--rate", default="100", help="open loop: comma-separated arrival rates (req/s)")
+    p_run.add_argument("--duration", type=float, default=5.0, help="seconds per level")
+    p_run.add_argument("--warmup", type=int, default=20, help="requests sent before each level")
+    p_run.add_argument("--timeout", type=float, default=30.0, help="per-request HTTP timeout")
+    p_run.add_argument("--cache", action="store_true", help="let the hub answer from its result cache")
+    p_run.add_argument("--no-boot", action="store_true", help="use agents that are already running")
+    p_run.add_argument("--out", help="result file (default bench_results/bench-<commit>-<ts>.json)")
+
+    p_cmp = sub.add_parser("compare", help="diff two result files")
+    p_cmp.add_argument("before")
+    p_cmp.add_argument("after")
+
+    p_serve = sub.add_parser("serve-agent", help=argparse.SUPPRESS)
+    p_serve.add_argument("agent", choices=list(BENCH_AGENTS))
+
+    args = parser.parse_args()
+    if args.command == "serve-agent":
+        serve_agent(args.agent)
+    elif args.command == "compare":
+        compare(args.before, args.after)
+    else:
+        for target in args.targets.split(","):
+            kind, _, name = target.partition(":")
+            if (kind, name) not in {tuple(t.split(":", 1)) for t in all_targets}:
+                parser.error(f"unknown target {target!r}")
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
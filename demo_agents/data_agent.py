@@ -1,14 +1,20 @@
 import asyncio
+import os
+import sys
 import time
 import requests
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Set
 
 # ✅ FastMCP client imports (correct for v2.13.0)
 from fastmcp import Client as FastMCPClient
 from fastmcp.client.transports import PythonStdioTransport
 
+# the index shared with agents/agent3 lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from user_index import UserIndex  # noqa: E402
+
 app = FastAPI(title="DataAgent")
 AGENT_NAME = "DataAgent"
 
@@ -22,6 +28,9 @@ DB: Dict[int, Dict[str, Any]] = {
 # Heartbeat config
 HEARTBEAT_INTERVAL = 5  # seconds
 
+# ---- Secondary indexes (role + name/email trigrams, maintained on insert) ----
+INDEX = UserIndex(DB)
+
 class CallIn(BaseModel):
     input: Dict[str, Any]
     meta: Dict[str, Any] = {}
@@ -56,21 +65,22 @@ def call(payload: CallIn):
     if q == "search":
         term = str(inp.get("term", "")).lower()
         by_role = inp.get("role")
-        results: List[Dict[str, Any]] = []
-        for u in DB.values():
-            if by_role and u.get("role") == by_role:
-                results.append(u)
-            elif term and (term in u.get("name", "").lower() or term in u.get("email", "").lower()):
-                results.append(u)
+        ids: Set[int] = set()
+        if by_role:
+            ids |= INDEX.with_role(str(by_role))
+        if term:
+            ids |= INDEX.matching(term)
+        results: List[Dict[str, Any]] = [DB[uid] for uid in sorted(ids)]
         return {"status": "ok", "result": {"data": results}, "meta": {"agent": AGENT_NAME}}
 
     if q == "insert":
         payload_data = inp.get("data")
         if not isinstance(payload_data, dict):
             raise HTTPException(status_code=400, detail="data object required for insert")
-        new_id = max(DB.keys()) + 1 if DB else 1
-        payload_data["id"] = new_id
-        DB[new_id] = payload_data
+        try:
+            INDEX.insert(payload_data)  # id, store write and indexing under the index lock
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         return {"status": "ok", "result": {"data": payload_data}, "meta": {"agent": AGENT_NAME}}
 
     raise HTTPException(status_code=400, detail="unknown query")
@@ -1,10 +1,13 @@
 # finance_agent.py
-import json
 import random
 import time
 
-agent_status = {"FinanceAgent": "healthy"}
-finance_data = {}
+from status_bus import BusClient, ensure_broker
+
+# Status and data are published on the local status bus (status_bus.py) instead of
+# being rewritten to agent_status.json / finance_data.json for others to poll.
+ensure_broker()
+bus = BusClient()
 
 print("🟢 FinanceAgent started...")
 
@@ -13,10 +16,10 @@ while True:
 
     # Randomly make agent fail or healthy
     if random.random() < 0.2:
-        agent_status["FinanceAgent"] = "failed"
+        bus.publish("status", "FinanceAgent", "failed")
         print("⚠️ FinanceAgent simulated task failure")
     else:
-        agent_status["FinanceAgent"] = "healthy"
+        bus.publish("status", "FinanceAgent", "healthy")
         print("✅ FinanceAgent heartbeat sent.")
 
         # Generate some fake financial data
@@ -27,12 +30,5 @@ while True:
             "profit": random.randint(2000, 10000)
         }
 
-        # Write data to JSON
-        with open("finance_data.json", "w") as f:
-            json.dump(finance_data, f, indent=4)
-
+        bus.publish("finance", values=finance_data)
         print("💾 Finance data updated:", finance_data)
-
-    # Update agent health status
-    with open("agent_status.json", "w") as f:
-        json.dump(agent_status, f)
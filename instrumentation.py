@@ -0,0 +1,635 @@
+"""
+instrumentation.py — shared latency/throughput metrics for the hub and the agents.
+
+A small in-process registry of counters, gauges and fixed-bucket histograms,
+rendered in the Prometheus text format (GET /metrics) or as JSON with
+p50/p95/p99 estimates (the hub's hub_metrics tool). No client library needed.
+
+Agents call instrument_app(app, "data-agent") once. This installs an ASGI
+middleware that records, per route and per input.query (or another input field):
+  http_requests_total{path,query,status}
+  http_request_duration_ms{path,query}      (until the last body byte is sent)
+  http_request_bytes / http_response_bytes  {path}
+  http_in_flight{path}
+It also adds GET /metrics. Each response carries `Server-Timing: app;dur=<ms>`,
+the time spent in the handler before the response started. The hub subtracts it
+from its round trip to get the network/queueing share of the hop.
+
+Tracing: the hub puts {"trace_id", "parent_span_id", "deadline"} into the
+`meta` of every /call body. A /call handler decorated with @traced_call returns
+{"trace": {"trace_id", "span_id", "start", "parse_ms", "handler_ms"}} in its
+response meta, and the middleware adds the serialize time to Server-Timing.
+Spans go to an in-process ring buffer (GET /traces) and, when TRACE_FILE is
+set, are appended to that JSONL file. critical_path() rebuilds the slowest
+chain of a trace from its spans.
+
+Deadlines and cancellation: @deadline_call refuses /call work whose
+meta.deadline has already passed, and cuts async handlers off when it passes
+(504). DisconnectMiddleware cancels the handler when the caller hangs up
+(logged as status 499), so work nobody waits for stops, upstream model calls
+included.
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# milliseconds; covers in-process math (sub-ms) up to slow LLM calls
+DEFAULT_BUCKETS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+MAX_QUERY_BODY = 64 * 1024  # don't parse bigger bodies just to find input.query
+MAX_QUERY_LABELS = 64       # distinct query label values per app; the rest become "other"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(key: LabelKey, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower * 2 or 1.0
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Thread-safe registry; agents update it from the event loop and threadpool alike."""
+
+    def __init__(self, namespace: str = ""):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def gauge_add(self, name: str, amount: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def gauge_set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self._buckets.setdefault(name, buckets))
+            hist.observe(value)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        prefix = f"{self.namespace}_" if self.namespace else ""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                lines += [f"{prefix}{name}{_fmt_labels(k)} {_num(v)}" for k, v in series.items()]
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {prefix}{name} gauge")
+                lines += [f"{prefix}{name}{_fmt_labels(k)} {_num(v)}" for k, v in series.items()]
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, n in zip(list(hist.buckets) + [math.inf], hist.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == math.inf else _num(bound)
+                        lines.append(f"{prefix}{name}_bucket{_fmt_labels(key, [('le', le)])} {cumulative}")
+                    lines.append(f"{prefix}{name}_sum{_fmt_labels(key)} {_num(hist.sum)}")
+                    lines.append(f"{prefix}{name}_count{_fmt_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """JSON view: counters/gauges as-is, histograms as count/avg/p50/p95/p99."""
+        def label_str(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key) or "_"
+
+        def rounded(x: Optional[float]) -> Optional[float]:
+            return None if x is None else round(x, 3)
+
+        with self._lock:
+            return {
+                "counters": {n: {label_str(k): v for k, v in s.items()} for n, s in self._counters.items()},
+                "gauges": {n: {label_str(k): v for k, v in s.items()} for n, s in self._gauges.items()},
+                "histograms": {
+                    n: {label_str(k): {"count": h.count,
+                                       "avg": rounded(h.sum / h.count) if h.count else None,
+                                       "p50": rounded(h.quantile(0.5)),
+                                       "p95": rounded(h.quantile(0.95)),
+                                       "p99": rounded(h.quantile(0.99))}
+                        for k, h in s.items()}
+                    for n, s in self._histograms.items()
+                },
+            }
+
+
+# ------------------------------------------------------------
+# Tracing
+# ------------------------------------------------------------
+TRACE_BUFFER = int(os.environ.get("TRACE_BUFFER", "4096"))  # spans kept in memory per process
+TRACE_FILE = os.environ.get("TRACE_FILE")                     # optional JSONL span log
+
+_CURRENT_SPAN: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+def new_id(nbytes: int = 8) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "service", "start", "duration_ms", "attrs", "_t0")
+
+    def __init__(self, name: str, service: str, trace_id: str, parent_id: Optional[str] = None,
+                 span_id: Optional[str] = None, **attrs):
+        self.trace_id = trace_id
+        self.span_id = span_id or new_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.service = service
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.attrs: Dict[str, Any] = attrs
+        self._t0 = time.perf_counter()
+
+    def finish(self) -> None:
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "name": self.name, "service": self.service, "start": self.start,
+                "duration_ms": self.duration_ms, "attrs": self.attrs}
+
+
+class Tracer:
+    """Collects finished spans of one process in a ring buffer and, optionally, a JSONL file."""
+
+    def __init__(self, service: str, buffer_size: int = TRACE_BUFFER, path: Optional[str] = TRACE_FILE):
+        self.service = service
+        self.path = path
+        self.spans: "deque[dict]" = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    def export(self, span: dict) -> None:
+        with self._lock:
+            self.spans.append(span)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span, default=str) + "\n")
+
+    def start_span(self, name: str, **attrs) -> Span:
+        """New span under the current one (or a new trace's root); not made current."""
+        parent = _CURRENT_SPAN.get()
+        if parent is not None:
+            return Span(name, self.service, parent.trace_id, parent.span_id, **attrs)
+        return Span(name, self.service, new_id(16), **attrs)
+
+    def end_span(self, span: Span) -> None:
+        span.finish()
+        self.export(span.to_dict())
+
+    @contextmanager
+    def span(self, name: str, require_trace: bool = False, **attrs) -> Iterator[Span]:
+        """
+        start_span() made current for the duration of the block. With
+        require_trace the span is only exported when it joins an existing trace
+        (keeps background work like health probes out of the buffer).
+        """
+        exported = not require_trace or _CURRENT_SPAN.get() is not None
+        span = self.start_span(name, **attrs)
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            _CURRENT_SPAN.reset(token)
+            if exported:
+                self.end_span(span)
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _CURRENT_SPAN.get()
+
+    def trace(self, trace_id: str) -> List[dict]:
+        with self._lock:
+            return sorted((s for s in self.spans if s["trace_id"] == trace_id), key=lambda s: s["start"])
+
+    def slowest(self, limit: int = 10) -> List[dict]:
+        """Root spans in the buffer, slowest first."""
+        with self._lock:
+            roots = [s for s in self.spans if s["parent_id"] is None and s["duration_ms"] is not None]
+        return sorted(roots, key=lambda s: -s["duration_ms"])[:limit]
+
+
+def critical_path(spans: List[dict]) -> List[dict]:
+    """
+    Root-to-leaf chain that determined the trace's duration: from the root,
+    repeatedly follow the child that finished last.
+    """
+    def end(span: dict) -> float:
+        return span["start"] + (span["duration_ms"] or 0) / 1000
+
+    if not spans:
+        return []
+    ids = {s["span_id"] for s in spans}
+    children: Dict[Optional[str], List[dict]] = {}
+    for s in spans:
+        children.setdefault(s["parent_id"] if s["parent_id"] in ids else None, []).append(s)
+    path = [max(children[None], key=lambda s: s["duration_ms"] or 0)]
+    while children.get(path[-1]["span_id"]):
+        path.append(max(children[path[-1]["span_id"]], key=end))
+    return [{"name": s["name"], "service": s["service"], "span_id": s["span_id"],
+             "duration_ms": s["duration_ms"], "attrs": s["attrs"]} for s in path]
+
+
+# per-request phase marks shared by MetricsMiddleware and @traced_call
+_REQUEST_MARKS: "contextvars.ContextVar[Optional[dict]]" = contextvars.ContextVar("request_marks", default=None)
+
+
+def _call_meta(args: tuple, kwargs: dict) -> dict:
+    for value in list(kwargs.values()) + list(args):
+        meta = getattr(value, "meta", None)
+        if isinstance(meta, dict):
+            return meta
+    return {}
+
+
+def _begin_handler(args: tuple, kwargs: dict) -> Optional[dict]:
+    marks = _REQUEST_MARKS.get()
+    if marks is None:
+        return None
+    meta = _call_meta(args, kwargs)
+    marks["handler_start"] = time.perf_counter()
+    if meta.get("trace_id"):
+        marks.update(trace_id=str(meta["trace_id"]), parent_id=meta.get("parent_span_id"),
+                     span_id=new_id(), deadline=meta.get("deadline"))
+    return marks
+
+
+def _end_handler(marks: Optional[dict], result: Any) -> Any:
+    if marks is None:
+        return result
+    marks["handler_end"] = time.perf_counter()
+    meta = result.get("meta") if isinstance(result, dict) else getattr(result, "meta", None)
+    if marks.get("trace_id") and isinstance(meta, dict):
+        meta["trace"] = {
+            "trace_id": marks["trace_id"],
+            "span_id": marks["span_id"],
+            "start": marks["start"],
+            "parse_ms": round((marks["handler_start"] - marks["t0"]) * 1000, 3),
+            "handler_ms": round((marks["handler_end"] - marks["handler_start"]) * 1000, 3),
+        }
+    return result
+
+
+def traced_call(fn):
+    """
+    Decorator for an agent's /call endpoint (below @app.post): marks the
+    handler phase for the middleware and, when the hub sent a trace context in
+    `meta`, returns the agent's span ids and phase timings in the response meta.
+    """
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            marks = _begin_handler(args, kwargs)
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException:
+                _end_handler(marks, None)
+                raise
+            return _end_handler(marks, result)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        marks = _begin_handler(args, kwargs)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            _end_handler(marks, None)
+            raise
+        return _end_handler(marks, result)
+    return wrapper
+
+
+def deadline_call(fn):
+    """
+    Decorator for an agent's /call endpoint (below @traced_call): enforce the
+    absolute deadline (epoch seconds) the hub put in meta.deadline. Expired
+    requests are refused with 504 before any work is done. Async handlers are
+    also cancelled with 504 once the deadline passes. Sync handlers run in the
+    threadpool, which can't be interrupted, so they are only checked on entry.
+    """
+    from starlette.exceptions import HTTPException
+
+    def remaining(args: tuple, kwargs: dict) -> Optional[float]:
+        deadline = _call_meta(args, kwargs).get("deadline")
+        if deadline is None:
+            return None
+        left = float(deadline) - time.time()
+        if left <= 0:
+            raise HTTPException(status_code=504, detail="deadline exceeded before the request was handled")
+        return left
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            left = remaining(args, kwargs)
+            if left is None:
+                return await fn(*args, **kwargs)
+            try:
+                return await asyncio.wait_for(fn(*args, **kwargs), left)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=504, detail="deadline exceeded") from None
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        remaining(args, kwargs)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+# ------------------------------------------------------------
+# ASGI middleware for the FastAPI agents
+# ------------------------------------------------------------
+def _query_of(body: bytes, field: str = "query") -> str:
+    """input[field] of a /call body, or "-" when there is none."""
+    if not body or len(body) > MAX_QUERY_BODY:
+        return "-"
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return "-"
+    inp = data.get("input") if isinstance(data, dict) else None
+    query = inp.get(field) if isinstance(inp, dict) else None
+    return str(query)[:64] if query else "-"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware, so streaming responses pass through untouched.
+    Paths that aren't routes of the app are reported as "other" to keep label
+    cardinality bounded.
+    """
+
+    def __init__(self, app, metrics: Metrics, routes: list, query_field: str = "query",
+                 tracer: Optional[Tracer] = None):
+        self.app = app
+        self.metrics = metrics
+        self.tracer = tracer
+        self.query_field = query_field
+        self.routes = routes  # the app's live route list; routes may be added after instrumenting
+        self._paths: set = set()
+        self._seen_routes = -1
+        self._queries: set = set()
+
+    def _route_path(self, path: str) -> str:
+        if self._seen_routes != len(self.routes):
+            self._paths = {getattr(route, "path", None) for route in self.routes}
+            self._seen_routes = len(self.routes)
+        return path if path in self._paths else "other"
+
+    def _query_label(self, body: bytes) -> str:
+        query = _query_of(body, self.query_field)
+        if query not in self._queries:
+            if len(self._queries) >= MAX_QUERY_LABELS:
+                return "other"
+            self._queries.add(query)
+        return query
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = self._route_path(scope["path"])
+        metrics = self.metrics
+        started = time.perf_counter()
+        body = bytearray()
+        sizes = {"in": 0, "out": 0}
+        state = {"status": 500}
+        marks = {"t0": started, "start": time.time()}
+        token = _REQUEST_MARKS.set(marks)
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                sizes["in"] += len(chunk)
+                if len(body) <= MAX_QUERY_BODY:
+                    body.extend(chunk)
+            return message
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                now = marks["response_start"] = time.perf_counter()
+                timing = f"app;dur={(now - started) * 1000:.3f}"
+                if "handler_end" in marks:
+                    timing += (f", parse;dur={(marks['handler_start'] - started) * 1000:.3f}"
+                               f", handler;dur={(marks['handler_end'] - marks['handler_start']) * 1000:.3f}"
+                               f", serialize;dur={(now - marks['handler_end']) * 1000:.3f}")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.encode()))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                sizes["out"] += len(message.get("body", b""))
+            await send(message)
+
+        metrics.gauge_add("http_in_flight", 1, path=path)
+        try:
+            await self.app(scope, counting_receive, timed_send)
+        finally:
+            _REQUEST_MARKS.reset(token)
+            metrics.gauge_add("http_in_flight", -1, path=path)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            query = self._query_label(bytes(body)) if scope["method"] == "POST" else "-"
+            status = 499 if marks.get("cancelled") else state["status"]  # 499: client closed request
+            metrics.inc("http_requests_total", path=path, query=query, status=status)
+            metrics.observe("http_request_duration_ms", elapsed_ms, path=path, query=query)
+            metrics.observe("http_request_bytes", sizes["in"], SIZE_BUCKETS, path=path)
+            metrics.observe("http_response_bytes", sizes["out"], SIZE_BUCKETS, path=path)
+            if self.tracer is not None and marks.get("trace_id"):
+                self._export_span(marks, path, query, status, elapsed_ms)
+
+    def _export_span(self, marks: dict, path: str, query: str, status: int, elapsed_ms: float) -> None:
+        def ms(a: str, b: str) -> Optional[float]:
+            return round((marks[b] - marks[a]) * 1000, 3) if a in marks and b in marks else None
+
+        self.tracer.export({
+            "trace_id": marks["trace_id"], "span_id": marks["span_id"], "parent_id": marks.get("parent_id"),
+            "name": f"{path} {query}", "service": self.tracer.service, "start": marks["start"],
+            "duration_ms": round(elapsed_ms, 3),
+            "attrs": {"status": status, "deadline": marks.get("deadline"),
+                      "parse_ms": ms("t0", "handler_start"), "handler_ms": ms("handler_start", "handler_end"),
+                      "serialize_ms": ms("handler_end", "response_start")},
+        })
+
+
+class DisconnectMiddleware:
+    """
+    Cancels the request's handler when the client disconnects before the
+    response is complete, e.g. the hub gave up or its MCP caller cancelled.
+    Once the body has been read, a watcher task owns receive() and the app's
+    own later receive() calls wait for the same disconnect.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        disconnected = asyncio.Event()
+        state = {"body_done": False, "response_done": False, "watcher": None}
+
+        async def watch() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+            if not state["response_done"]:  # servers also report disconnect once the response is out
+                app_task.cancel()
+
+        async def watched_send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["response_done"] = True
+            await send(message)
+
+        async def watched_receive():
+            if state["body_done"]:
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                state["body_done"] = True
+                state["watcher"] = asyncio.ensure_future(watch())
+            return message
+
+        app_task = asyncio.ensure_future(self.app(scope, watched_receive, watched_send))
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not disconnected.is_set() or state["response_done"]:
+                raise  # the server itself is cancelling us
+            marks = _REQUEST_MARKS.get()
+            if marks is not None:
+                marks["cancelled"] = True
+        finally:
+            if state["watcher"] is not None:
+                state["watcher"].cancel()
+            if not app_task.done():
+                app_task.cancel()
+
+
+def instrument_app(app, namespace: str, query_field: str = "query") -> Metrics:
+    """
+    Attach MetricsMiddleware, DisconnectMiddleware and the GET /metrics and
+    GET /traces routes to a FastAPI app and return its metrics registry (the
+    tracer is app.state.tracer).
+    `query_field` names the input key that selects the operation
+    (math-agent: "operation", health-agent: "cmd").
+    """
+    from starlette.responses import PlainTextResponse
+
+    metrics = Metrics(re.sub(r"\W", "_", namespace))
+    tracer = app.state.tracer = Tracer(namespace)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/traces", include_in_schema=False)
+    def traces_endpoint(trace_id: Optional[str] = None, limit: int = 10):
+        if trace_id:
+            spans = tracer.trace(trace_id)
+            return {"trace_id": trace_id, "spans": spans, "critical_path": critical_path(spans)}
+        return {"slowest": tracer.slowest(limit)}
+
+    app.add_middleware(DisconnectMiddleware)  # inner: runs inside MetricsMiddleware
+    app.add_middleware(MetricsMiddleware, metrics=metrics, routes=app.router.routes,
+                       query_field=query_field, tracer=tracer)
+    return metrics
+
+
+def parse_server_timing(header: Optional[str], name: str = "app") -> Optional[float]:
+    """Duration in ms of the `name` metric in a Server-Timing header, if present."""
+    if not header:
+        return None
+    for part in header.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if fields[0] != name:
+            continue
+        for field in fields[1:]:
+            if field.startswith("dur="):
+                try:
+                    return float(field[4:])
+                except ValueError:
+                    return None
+    return None
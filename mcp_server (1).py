@@ -25,35 +25,205 @@
 # if __name__ == "__main__":
 #     import uvicorn
 #     uvicorn.run(app, host="127.0.0.1", port=8000)
+import asyncio
+import heapq
+import math
+import time
+from collections import deque
+from typing import Dict, List, Literal, Optional
+
 from fastapi import FastAPI
 from pydantic import BaseModel
 import uvicorn
 
 app = FastAPI()
-agent_status = {"FinanceAgent": "healthy"}
 
+# ------------------------------------------------------------
+# Failure detection
+# ------------------------------------------------------------
+# Phi-accrual detector with exponentially distributed heartbeat gaps:
+#   phi(t) = (t / mean_interval) * log10(e)
+# so a phi threshold turns into a fixed deadline after the last heartbeat.
+# Each agent has one entry in a min-heap of deadlines and one timer task
+# sleeps until the earliest of them; there is no per-agent polling loop.
+SUSPECT_PHI = 1.0
+FAILED_PHI = 3.0
+DEFAULT_INTERVAL = 1.0   # assumed heartbeat gap until an agent has history
+MIN_INTERVAL = 0.05
+EWMA_ALPHA = 0.2
+CHANGE_LOG_SIZE = 100_000  # status changes kept for /status?since= deltas
+LOG10_E = math.log10(math.e)
+
+
+class AgentState:
+    __slots__ = ("name", "status", "last_seen", "mean_interval", "version", "scheduled")
+
+    def __init__(self, name: str, now: float):
+        self.name = name
+        self.status = "healthy"
+        self.last_seen = now
+        self.mean_interval = DEFAULT_INTERVAL
+        self.version = 0
+        self.scheduled: Optional[float] = None  # deadline of the agent's live heap entry
+
+    def deadline(self, phi: float) -> float:
+        return self.last_seen + phi * self.mean_interval / LOG10_E
+
+    def phi(self, now: float) -> float:
+        return (now - self.last_seen) / self.mean_interval * LOG10_E
+
+
+agents: Dict[str, AgentState] = {}
+deadlines: List[tuple] = []          # (deadline, name) — one live entry per agent, see _schedule
+version = 0
+change_log: deque = deque(maxlen=CHANGE_LOG_SIZE)  # (version, name), versions contiguous
+_timer_wakeup: Optional[asyncio.Event] = None
+
+
+def set_status(state: AgentState, status: str) -> None:
+    """Record a status transition and append it to the change log."""
+    global version
+    if state.status == status and state.version:
+        return
+    if state.status != status:
+        print(f"⚠️ {state.name}: {state.status} -> {status}")
+    state.status = status
+    version += 1
+    state.version = version
+    change_log.append((version, state.name))
+
+
+def _schedule(state: AgentState) -> None:
+    """
+    Push the agent's next deadline, waking the timer if it is now the earliest.
+    A live entry that fires no later is kept (the timer re-arms it then); an
+    earlier deadline supersedes it, and the timer skips the stale entry when
+    it pops, since it no longer matches state.scheduled.
+    """
+    phi = SUSPECT_PHI if state.status == "healthy" else FAILED_PHI
+    # never in the past: the timer would pop and re-push it without sleeping
+    when = max(state.deadline(phi), time.time() + MIN_INTERVAL)
+    if state.scheduled is not None and state.scheduled <= when:
+        return
+    state.scheduled = when
+    wake = not deadlines or when < deadlines[0][0]
+    heapq.heappush(deadlines, (when, state.name))
+    if wake and _timer_wakeup is not None:
+        _timer_wakeup.set()
+
+
+def ingest_heartbeat(name: str, now: float) -> None:
+    state = agents.get(name)
+    if state is None:
+        state = agents[name] = AgentState(name, now)
+        set_status(state, "healthy")
+        _schedule(state)
+        return
+    gap = max(now - state.last_seen, MIN_INTERVAL)
+    state.mean_interval += EWMA_ALPHA * (gap - state.mean_interval)
+    state.last_seen = now
+    if state.status != "healthy":
+        set_status(state, "healthy")
+        _schedule(state)
+    # otherwise the existing heap entry is simply found early and re-armed
+
+
+async def failure_timer() -> None:
+    """Sleep until the earliest deadline, then mark overdue agents suspect/failed."""
+    global _timer_wakeup
+    _timer_wakeup = asyncio.Event()
+    while True:
+        timeout = deadlines[0][0] - time.time() if deadlines else None
+        _timer_wakeup.clear()
+        try:
+            await asyncio.wait_for(_timer_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        now = time.time()
+        while deadlines and deadlines[0][0] <= now:
+            when, name = heapq.heappop(deadlines)
+            state = agents.get(name)
+            if state is None or state.scheduled != when:
+                continue  # superseded by an earlier deadline
+            state.scheduled = None
+            if state.status == "failed":
+                continue
+            phi = state.phi(now)
+            if phi >= FAILED_PHI:
+                set_status(state, "failed")
+                continue  # no further deadline until the next heartbeat
+            if phi >= SUSPECT_PHI and state.status == "healthy":
+                set_status(state, "suspect")
+            _schedule(state)  # heartbeat arrived since this entry was pushed, or now suspect
+
+
+def agent_view(state: AgentState, now: float) -> dict:
+    return {"status": state.status, "last_seen": state.last_seen,
+            "phi": round(state.phi(now), 3), "version": state.version}
+
+
+@app.on_event("startup")
+async def on_startup():
+    asyncio.create_task(failure_timer())
+
+# ------------------------------------------------------------
+# API
+# ------------------------------------------------------------
 class Heartbeat(BaseModel):
     name: str
 
+class HeartbeatBatch(BaseModel):
+    names: List[str]
+
 class Report(BaseModel):
     name: str
-    status: str
+    status: Literal["healthy", "suspect", "failed"]  # the states failure_timer knows how to advance
 
 @app.post("/heartbeat")
-def heartbeat(data: Heartbeat):
-    agent_status[data.name] = "healthy"
-    print(f"✅ {data.name} heartbeat received.")
+async def heartbeat(data: Heartbeat):
+    ingest_heartbeat(data.name, time.time())
     return {"message": "Heartbeat OK"}
 
+@app.post("/heartbeats")
+async def heartbeats(data: HeartbeatBatch):
+    """Batched heartbeats: one request for many agents."""
+    now = time.time()
+    for name in data.names:
+        ingest_heartbeat(name, now)
+    return {"message": "Heartbeats OK", "count": len(data.names)}
+
 @app.post("/report")
-def report(data: Report):
-    agent_status[data.name] = data.status
-    print(f"⚠️ {data.name} reported status: {data.status}")
+async def report(data: Report):
+    state = agents.get(data.name)
+    if state is None:
+        ingest_heartbeat(data.name, time.time())
+        state = agents[data.name]
+    set_status(state, data.status)
     return {"message": "Report received"}
 
 @app.get("/status")
-def get_status():
-    return agent_status
+async def get_status(since: Optional[int] = None):
+    """
+    Without `since`: {agent: status} for every agent.
+    With `since=v`: only agents whose status changed after version v, plus the
+    current version to pass next time. If v is older than the change log, or 0,
+    the full set is returned with "full": true.
+    """
+    if since is None:
+        return {name: state.status for name, state in agents.items()}
+
+    now = time.time()
+    oldest = change_log[0][0] if change_log else version + 1
+    if since <= 0 or since < oldest - 1:
+        changed = agents.values()
+        full = True
+    else:
+        start = since - oldest + 1
+        names = {change_log[i][1] for i in range(start, len(change_log))}
+        changed = [agents[n] for n in names]
+        full = False
+    return {"version": version, "full": full,
+            "agents": {state.name: agent_view(state, now) for state in changed}}
 
 if __name__ == "__main__":
     print("🟢 MCP Server started on port 8000...")
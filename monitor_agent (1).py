@@ -1,28 +1,26 @@
-import json
+from status_bus import BusClient, ensure_broker
 import time
 
+# Reacts to status changes pushed by the status bus instead of re-reading
+# agent_status.json every few seconds.
+ensure_broker()
+bus = BusClient(topics=["status"])
+
 print("👀 Monitor Agent started...")
 
 while True:
-    try:
-        # Read the current agent status
-        with open("agent_status.json", "r") as f:
-            data = json.load(f)
-        
-        # Check if agent failed
-        if data["FinanceAgent"] == "failed":
-            print("⚠️ FinanceAgent failed. Healing initiated...")
-            time.sleep(2)
-            print("✅ FinanceAgent restored successfully!")
-            data["FinanceAgent"] = "healthy"
-
-            # Update file after healing
-            with open("agent_status.json", "w") as f:
-                json.dump(data, f)
-        else:
-            print("💚 FinanceAgent is healthy.")
-
-    except FileNotFoundError:
-        print("Waiting for MCP server to create status file...")
+    event = bus.next_event()
+    if event["op"] == "closed":
+        print("Status bus connection closed, stopping monitor.")
+        break
 
-    time.sleep(3)
+    status = bus.get("status", "FinanceAgent")
+    if status is None:
+        print("Waiting for FinanceAgent to report...")
+    elif status == "failed":
+        print("⚠️ FinanceAgent failed. Healing initiated...")
+        time.sleep(2)
+        print("✅ FinanceAgent restored successfully!")
+        bus.publish("status", "FinanceAgent", "healthy")
+    else:
+        print("💚 FinanceAgent is healthy.")
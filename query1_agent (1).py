@@ -1,5 +1,5 @@
 import json
-import time
+from status_bus import BusClient, ensure_broker
 
 def route_query(user_query):
     if "finance" in user_query.lower() or "budget" in user_query.lower():
@@ -7,6 +7,12 @@ def route_query(user_query):
     else:
         return "Unknown"
 
+# Health and finance data are kept current in memory by the status bus, so a
+# query never has to open or parse the JSON files.
+ensure_broker()
+bus = BusClient(topics=["status", "finance"])
+bus.wait_synced()
+
 print("💬 QueryAgent started...")
 while True:
     query = input("\nEnter your query: ")
@@ -14,17 +20,14 @@ while True:
     agent = route_query(query)
     print(f"➡️ Routing query to: {agent}")
 
-    # Read health info
-    with open("agent_status.json", "r") as f:
-        status = json.load(f)
-
-    if agent in status and status[agent] == "healthy":
+    if bus.get("status", agent) == "healthy":
         print(f"✅ {agent} is healthy. Fetching data...")
 
-        # Fetch finance data
-        with open("finance_data.json", "r") as f:
-            data = json.load(f)
-        print(f"📊 Latest Finance Data:\n{json.dumps(data, indent=4)}")
+        data = bus.state.get("finance")
+        if data:
+            print(f"📊 Latest Finance Data:\n{json.dumps(data, indent=4)}")
+        else:
+            print("No finance data published yet.")
 
     else:
         print(f"❌ {agent} is FAILED or unavailable. Try again later.")
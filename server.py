@@ -3,16 +3,29 @@ server.py — Central MCP Orchestrator (manual tool registration)
 Compatible with FastMCP versions that require manual mcp.add_tool(...) registration.
 """
 
+import asyncio
+import json
+import math
+import os
+import re
 import time
-from typing import Dict, Any, Optional
+from collections import OrderedDict, deque
+from functools import lru_cache
+from contextlib import aclosing, asynccontextmanager, nullcontext
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple, Union
 import httpx
-from fastmcp import FastMCP  # import the core only, avoid decorator imports
+from fastmcp import Context, FastMCP  # import the core only, avoid decorator imports
+from fastmcp.server.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from instrumentation import SIZE_BUCKETS, Metrics, Tracer, critical_path, parse_server_timing
 
 # ------------------------------------------------------------
 # Configuration
 # ------------------------------------------------------------
 SERVER_NAME = "mcp-central-hub"
-AGENTS: Dict[str, str] = {
+# An agent maps to one base URL or to a list of interchangeable replica URLs.
+AGENTS: Dict[str, Union[str, List[str]]] = {
     "finance-agent": "http://127.0.0.1:8001",
     "data-agent": "http://127.0.0.1:8002",
     "math-agent": "http://127.0.0.1:8003",
@@ -20,52 +33,1312 @@ AGENTS: Dict[str, str] = {
     "summarizer-gemini": "http://127.0.0.1:8005",
 }
 
+@asynccontextmanager
+async def hub_lifespan(server: FastMCP):
+    """Run the background health prober and release the HTTP client on shutdown."""
+    prober = asyncio.create_task(health_prober())
+    try:
+        yield
+    finally:
+        prober.cancel()
+        await close_http_client()
+
 # Create the FastMCP orchestrator
-mcp = FastMCP(SERVER_NAME, version="1.0.0")  # use 1.x style for compatibility
+mcp = FastMCP(SERVER_NAME, version="1.0.0", lifespan=hub_lifespan)  # use 1.x style for compatibility
 
 # ------------------------------------------------------------
-# Helper - synchronous HTTP calls (simple and reliable)
+# Helper - pooled async HTTP client shared by every tool
 # ------------------------------------------------------------
-def call_agent_sync(agent: str, endpoint: str, data: Optional[dict] = None, timeout: float = 15.0) -> dict:
+DEFAULT_TIMEOUT = 15.0
+MAX_CALL_TIMEOUT = 120.0        # longest deadline a caller may ask for with payload "timeout"
+AGENT_MAX_CONNECTIONS = 10      # concurrent requests allowed per agent
+KEEPALIVE_EXPIRY = 30.0         # seconds an idle keep-alive connection is kept
+HEALTH_DEADLINE = 3.0           # total budget for one health_all fan-out
+MAX_HEALTH_DEADLINE = 30.0      # longest fan-out budget a caller may ask for
+MAX_BATCH_ITEMS = 1000          # upper bound on items in one call_agents_batch
+BATCH_AGENT_CONCURRENCY = 4     # default per-agent concurrency inside one batch
+STREAM_RELAY_ROWS = 100         # NDJSON lines forwarded per progress notification
+
+_http_client: Optional[httpx.AsyncClient] = None
+_agent_slots: Dict[str, asyncio.Semaphore] = {}
+
+def get_http_client() -> httpx.AsyncClient:
     """
-    Synchronously call agent HTTP endpoints using httpx.Client.
-    Returns a dict with either the JSON response or an error description.
+    Return the hub's long-lived httpx.AsyncClient, creating it on first use.
+    Connections are kept alive between tool calls instead of being torn down.
     """
-    if agent not in AGENTS:
-        return {"error": f"Agent '{agent}' not found"}
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        endpoints = sum(len(agent_endpoints(a)) for a in AGENTS)
+        # one connection per endpoint beyond its call slots, kept for health probes
+        limits = httpx.Limits(
+            max_connections=(AGENT_MAX_CONNECTIONS + 1) * max(endpoints, 1),
+            max_keepalive_connections=(AGENT_MAX_CONNECTIONS + 1) * max(endpoints, 1),
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        _http_client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=limits)
+    return _http_client
+
+async def close_http_client() -> None:
+    """Close the shared client (call on shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def _agent_slot(base_url: str) -> asyncio.Semaphore:
+    """Per-endpoint semaphore capping in-flight requests to AGENT_MAX_CONNECTIONS."""
+    slot = _agent_slots.get(base_url)
+    if slot is None:
+        slot = _agent_slots[base_url] = asyncio.Semaphore(AGENT_MAX_CONNECTIONS)
+    return slot
+
+# ------------------------------------------------------------
+# Metrics and tracing (hub side; agents expose their own GET /metrics, /traces)
+# ------------------------------------------------------------
+METRICS = Metrics("hub")
+TRACER = Tracer("hub")
+
+def record_hop(agent: str, endpoint: str, resp: httpx.Response, elapsed_ms: float) -> None:
+    """
+    Split one hub->agent round trip into agent time (the agent's Server-Timing
+    header) and everything else: network, connection pool and agent queueing.
+    """
+    endpoint = endpoint.strip("/")
+    status = resp.status_code
+    outcome = "ok" if status < 400 else f"http_{status // 100}xx"
+    METRICS.inc("agent_calls_total", agent=agent, endpoint=endpoint, outcome=outcome)
+    METRICS.observe("agent_request_ms", elapsed_ms, agent=agent, endpoint=endpoint)
+    METRICS.observe("agent_request_bytes", len(resp.request.content), SIZE_BUCKETS, agent=agent)
+    METRICS.observe("agent_response_bytes", len(resp.content), SIZE_BUCKETS, agent=agent)
+    agent_ms = parse_server_timing(resp.headers.get("server-timing"))
+    if agent_ms is not None:
+        METRICS.observe("agent_handler_ms", agent_ms, agent=agent, endpoint=endpoint)
+        METRICS.observe("agent_network_ms", max(0.0, elapsed_ms - agent_ms), agent=agent, endpoint=endpoint)
+
+def traced_payload(data: dict, span, timeout: float) -> dict:
+    """Copy of a /call body with the trace context and absolute deadline in its meta."""
+    meta = dict(data.get("meta") or {})
+    meta.update(trace_id=span.trace_id, parent_span_id=span.span_id, deadline=time.time() + timeout)
+    return {**data, "meta": meta}
+
+def record_agent_span(agent: str, result: Any, resp: httpx.Response) -> None:
+    """Store the agent-side span it reported in its response meta next to the hub's spans."""
+    meta = result.get("meta") if isinstance(result, dict) else None
+    trace = meta.get("trace") if isinstance(meta, dict) else None
+    current = TRACER.current()
+    if not isinstance(trace, dict) or current is None or trace.get("trace_id") != current.trace_id:
+        return
+    header = resp.headers.get("server-timing")
+    TRACER.export({
+        "trace_id": trace["trace_id"], "span_id": trace.get("span_id"), "parent_id": current.span_id,
+        "name": f"{agent} handle", "service": agent, "start": trace.get("start"),
+        "duration_ms": parse_server_timing(header),
+        "attrs": {"parse_ms": trace.get("parse_ms"), "handler_ms": trace.get("handler_ms"),
+                  "serialize_ms": parse_server_timing(header, "serialize")},
+    })
+
+class ToolMetrics(Middleware):
+    """
+    Per-tool latency, in-flight count and outcome for every MCP tools/call.
+    Each call is also the root span of a trace.
+    """
+
+    async def on_call_tool(self, context, call_next):
+        tool = context.message.name
+        METRICS.gauge_add("tool_in_flight", 1, tool=tool)
+        started = time.perf_counter()
+        outcome = "exception"
+        try:
+            with TRACER.span(f"tool {tool}"):
+                result = await call_next(context)
+            outcome = "ok"
+            return result
+        finally:
+            METRICS.gauge_add("tool_in_flight", -1, tool=tool)
+            METRICS.inc("tool_calls_total", tool=tool, outcome=outcome)
+            METRICS.observe("tool_duration_ms", (time.perf_counter() - started) * 1000, tool=tool)
+
+def time_breakdown() -> Dict[str, dict]:
+    """Per agent: p50/p95 of the full hop, the agent handler and the remainder."""
+    histograms = METRICS.snapshot()["histograms"]
+    breakdown: Dict[str, dict] = {}
+    for name, part in (("agent_request_ms", "round_trip"), ("agent_handler_ms", "agent"),
+                       ("agent_network_ms", "network")):
+        for labels, stats in histograms.get(name, {}).items():
+            fields = dict(kv.split("=", 1) for kv in labels.split(","))
+            key = f"{fields['agent']}/{fields['endpoint']}"
+            breakdown.setdefault(key, {})[part] = {"p50": stats["p50"], "p95": stats["p95"], "count": stats["count"]}
+    return breakdown
+
+# ------------------------------------------------------------
+# Replica routing - least outstanding requests weighted by EWMA latency
+# ------------------------------------------------------------
+EWMA_ALPHA = 0.3                # weight of the newest latency sample
+REPLICA_COOLDOWN = 5.0          # seconds a replica is skipped after a transport failure
+MIN_RETRY_BUDGET = 0.05         # don't start a retry with less time than this left
+
+# Queries that are safe to resend to another replica after a failure
+# ("*" = every query of that agent). Anything else is only retried when the
+# first attempt could not even connect, i.e. the agent never saw it.
+IDEMPOTENT_QUERIES: Dict[str, set] = {
+    "data-agent": {"get_user", "list_users", "search"},
+    "math-agent": {"*"},
+    "health-agent": {"*"},
+    "summarizer-gemini": {"*"},
+}
+
+REPLICAS: Dict[str, Dict[str, Any]] = {}    # base url -> routing state
+
+def agent_endpoints(agent: str) -> List[str]:
+    """Base URLs registered for an agent (empty if unknown)."""
+    urls = AGENTS.get(agent)
+    if urls is None:
+        return []
+    if isinstance(urls, str):
+        urls = [urls]
+    return [u.rstrip("/") for u in urls]
 
-    base_url = AGENTS[agent].rstrip("/")
+def is_idempotent(agent: str, query: str) -> bool:
+    allowed = IDEMPOTENT_QUERIES.get(agent, set())
+    return "*" in allowed or query in allowed
+
+def replica_state(base_url: str) -> Dict[str, Any]:
+    state = REPLICAS.get(base_url)
+    if state is None:
+        state = REPLICAS[base_url] = {"outstanding": 0, "ewma_ms": None, "healthy": True, "down_until": 0.0}
+    return state
+
+def pick_replica(agent: str, exclude: List[str]) -> Optional[str]:
+    """
+    Choose the replica with the lowest (outstanding + 1) * EWMA latency among
+    those not known to be down; fall back to any untried replica if all are.
+    """
+    now = time.time()
+    candidates = [u for u in agent_endpoints(agent) if u not in exclude]
+    live = [u for u in candidates
+            if replica_state(u)["healthy"] and replica_state(u)["down_until"] <= now]
+    pool = live or candidates
+    if not pool:
+        return None
+    return min(pool, key=lambda u: (REPLICAS[u]["outstanding"] + 1) * (REPLICAS[u]["ewma_ms"] or 1.0))
+
+async def _call_replica(agent: str, base_url: str, endpoint: str, data: Optional[dict],
+                        timeout: float, caller_bound: bool = False) -> Tuple[dict, Optional[str]]:
+    """
+    One HTTP attempt against one replica. Returns (result, retry) where retry is
+    None (final answer), "connect" (nothing reached the agent, always safe to
+    retry), "idempotent" (agent may have seen it; retry idempotent calls only)
+    or "deadline" (the caller's budget ran out; see below).
+    `caller_bound` means `timeout` is the caller's remaining budget and shorter
+    than what the agent is judged by. Running out of it says nothing about the
+    agent, so the replica is not put in cooldown and the result is "deadline".
+    """
+    with TRACER.span(f"call {agent}", require_trace=data is None, replica=base_url, endpoint=endpoint,
+                     timeout=round(timeout, 3)) as span:
+        result, retry = await _send_to_replica(agent, base_url, endpoint, data, timeout, span, caller_bound)
+        if "error" in result:
+            span.attrs.update(error=result["error"], retry=retry)
+        return result, retry
+
+async def _send_to_replica(agent: str, base_url: str, endpoint: str, data: Optional[dict],
+                           timeout: float, span, caller_bound: bool = False) -> Tuple[dict, Optional[str]]:
+    state = replica_state(base_url)
     url = f"{base_url}/{endpoint.lstrip('/')}"
+    state["outstanding"] += 1
+    started = time.perf_counter()
     try:
-        with httpx.Client(timeout=timeout) as client:
+        client = get_http_client()
+        # health probes (the only GETs) skip the call slots: an agent busy with
+        # slow calls is busy, not down, and its probe must not queue behind them
+        async with _agent_slot(base_url) if data is not None else nullcontext():
+            span.attrs["pool_wait_ms"] = round((time.perf_counter() - started) * 1000, 3)
             if data is not None:
-                resp = client.post(url, json=data)
+                resp = await client.post(url, json=traced_payload(data, span, timeout), timeout=timeout)
             else:
-                resp = client.get(url)
-            resp.raise_for_status()
-            # try to parse JSON; fallback to text
-            try:
-                return resp.json()
-            except Exception:
-                return {"status": "ok", "text": resp.text}
+                resp = await client.get(url, timeout=timeout)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        ewma = state["ewma_ms"]
+        state["ewma_ms"] = elapsed_ms if ewma is None else ewma + EWMA_ALPHA * (elapsed_ms - ewma)
+        record_hop(agent, endpoint, resp, elapsed_ms)
+        span.attrs["status"] = resp.status_code
+        if resp.status_code == 504 and caller_bound and "deadline" in resp.text:
+            return {"error": f"deadline exceeded calling {url}", "agent": agent}, "deadline"
+        if resp.status_code >= 500:
+            return {"error": f"HTTP {resp.status_code} from {url}", "agent": agent}, "idempotent"
+        resp.raise_for_status()
+        # try to parse JSON; fallback to text
+        try:
+            result = resp.json()
+        except Exception:
+            return {"status": "ok", "text": resp.text}, None
+        record_agent_span(agent, result, resp)
+        return result, None
+    except httpx.TransportError as e:
+        if caller_bound and isinstance(e, httpx.TimeoutException):
+            METRICS.inc("agent_calls_total", agent=agent, endpoint=endpoint, outcome="deadline")
+            return {"error": f"deadline exceeded calling {url}", "agent": agent}, "deadline"
+        METRICS.inc("agent_calls_total", agent=agent, endpoint=endpoint, outcome="transport_error")
+        state["down_until"] = time.time() + REPLICA_COOLDOWN
+        retry = "connect" if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)) else "idempotent"
+        return {"error": str(e) or type(e).__name__, "agent": agent}, retry
     except Exception as e:
-        return {"error": str(e), "agent": agent}
+        return {"error": str(e), "agent": agent}, None
+    finally:
+        state["outstanding"] -= 1
+
+# ------------------------------------------------------------
+# Admission control (per agent, two priority classes)
+# ------------------------------------------------------------
+# CoDel-style: shedding is driven by how long requests wait, not by how many
+# are waiting. Bursts are absorbed: while the queue keeps draining, a waiter
+# may wait up to its caller's deadline. The interval scales with the agent's
+# service time, so one round of slow calls is never mistaken for congestion.
+# Once the shortest wait seen over an interval stays above the target, there
+# is a standing queue. From then on:
+#   - background calls are refused at once;
+#   - interactive waiters get at most one interval;
+#   - waiters that already sat a whole interval are shed when they reach
+#     the front of the queue.
+# The state clears as soon as the queue drains. Refused calls get an
+# immediate "overloaded" answer instead of adding to everyone's latency.
+ADMIT_TARGET = float(os.environ.get("HUB_ADMIT_TARGET_MS", "10")) / 1000
+ADMIT_INTERVAL = float(os.environ.get("HUB_ADMIT_INTERVAL_MS", "100")) / 1000   # minimum; see interval
+ADMIT_QUEUE_MAX = int(os.environ.get("HUB_ADMIT_QUEUE_MAX", "1000"))  # per agent and class; memory bound only
+PRIORITIES = ("interactive", "background")  # served strictly in this order
+
+class AgentAdmission:
+    """Concurrency limit plus priority wait queues for one agent."""
+
+    def __init__(self, agent: str, limit: int):
+        self.agent = agent
+        self.limit = limit
+        self.in_flight = 0
+        self.queues: Dict[str, deque] = {p: deque() for p in PRIORITIES}   # (enqueued_at, future)
+        self.queued: Dict[str, int] = {p: 0 for p in PRIORITIES}           # live waiters per class
+        self.standing = False
+        self.service: Optional[float] = None  # EWMA of admitted call durations, seconds
+        self._window_start = time.perf_counter()
+        self._window_min = float("inf")
+
+    @property
+    def interval(self) -> float:
+        return max(ADMIT_INTERVAL, self.service or 0.0)
+
+    @property
+    def target(self) -> float:
+        return self.interval * ADMIT_TARGET / ADMIT_INTERVAL
+
+    def _oldest_wait(self, now: float) -> float:
+        heads = [next((t for t, future in queue if not future.done()), now) for queue in self.queues.values()]
+        return now - min(heads)
+
+    def _roll(self, now: float) -> None:
+        if now - self._window_start >= self.interval:
+            if self._window_min == float("inf"):
+                # nobody was admitted for a whole interval: standing iff someone is stuck waiting
+                self.standing = self._oldest_wait(now) > self.target
+            else:
+                self.standing = self._window_min > self.target
+            self._window_start, self._window_min = now, float("inf")
+
+    def _observe(self, priority: str, delay: float) -> None:
+        self._window_min = min(self._window_min, delay)
+        METRICS.observe("admission_delay_ms", delay * 1000, agent=self.agent, priority=priority)
+
+    async def acquire(self, priority: str, max_wait: float) -> Optional[str]:
+        """Take a slot, waiting if needed. Returns None once admitted, else why the call was shed."""
+        now = time.perf_counter()
+        self._roll(now)
+        if self.in_flight < self.limit and not any(self.queued.values()):
+            self.standing = False  # the queue drained
+            self.in_flight += 1
+            self._observe(priority, 0.0)
+            return None
+        if self.standing and priority != "interactive":
+            return "standing queue"
+        if self.queued[priority] >= ADMIT_QUEUE_MAX:
+            return "queue full"
+
+        future = asyncio.get_running_loop().create_future()
+        self.queues[priority].append((now, future))
+        self.queued[priority] += 1
+        try:
+            await asyncio.wait({future}, timeout=min(max_wait, self.interval) if self.standing else max_wait)
+        except asyncio.CancelledError:
+            if not future.done():
+                self.queued[priority] -= 1
+                future.cancel()
+            elif future.result() is None:
+                self.release()  # granted just as our caller went away: pass the slot on
+            raise
+        if future.done():
+            return future.result()
+        self.queued[priority] -= 1
+        future.cancel()
+        waited = time.perf_counter() - now
+        self._observe(priority, waited)
+        self._roll(time.perf_counter())
+        return "queue delay"
+
+    def release(self, service: Optional[float] = None) -> None:
+        """
+        Free a slot after a call that took `service` seconds, handing it
+        straight to the oldest waiter of the highest class. While the queue is
+        standing, waiters that sat a whole interval are shed on the way.
+        """
+        self.in_flight -= 1
+        if service is not None:
+            self.service = service if self.service is None else self.service + EWMA_ALPHA * (service - self.service)
+        now = time.perf_counter()
+        self._roll(now)
+        if self.standing:
+            # every class, not just the one served next: background would otherwise starve unseen
+            for priority in PRIORITIES:
+                queue = self.queues[priority]
+                while queue and (queue[0][1].done() or now - queue[0][0] > self.interval):
+                    enqueued_at, future = queue.popleft()
+                    if not future.done():
+                        self.queued[priority] -= 1
+                        self._observe(priority, now - enqueued_at)
+                        future.set_result("standing queue")
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue:
+                enqueued_at, future = queue.popleft()
+                if future.done():
+                    continue  # timed out or cancelled while waiting
+                self.queued[priority] -= 1
+                self._observe(priority, now - enqueued_at)
+                self.in_flight += 1
+                future.set_result(None)
+                return
+        self.standing = False  # nobody left waiting: the queue drained
+
+    def snapshot(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": dict(self.queued),
+                "standing_queue": self.standing, "interval_ms": round(self.interval * 1000, 1)}
+
+
+ADMISSION: Dict[str, AgentAdmission] = {}
+
+def admission(agent: str) -> AgentAdmission:
+    gate = ADMISSION.get(agent)
+    if gate is None:
+        # as many concurrent calls as the agent's replicas have connection slots
+        gate = ADMISSION[agent] = AgentAdmission(agent, AGENT_MAX_CONNECTIONS * max(1, len(agent_endpoints(agent))))
+    return gate
+
+def overloaded_error(agent: str, priority: str, reason: str) -> dict:
+    METRICS.inc("admission_shed_total", agent=agent, priority=priority, reason=reason)
+    return {"error": "overloaded", "overloaded": True, "agent": agent, "priority": priority,
+            "reason": reason, "retry_after": round(admission(agent).interval, 3)}
+
+def unattempted_error(agent: str, priority: str) -> dict:
+    """
+    The answer for a call that was admitted but never sent: either the agent has
+    no endpoints, or the wait for admission left less than MIN_RETRY_BUDGET.
+    Neither says anything about the agent, so callers don't record it in the breaker.
+    """
+    if not agent_endpoints(agent):
+        return {"error": f"Agent '{agent}' has no endpoints", "agent": agent}
+    return overloaded_error(agent, priority, "deadline")
+
+# ------------------------------------------------------------
+# Circuit breakers and adaptive timeouts (per agent)
+# ------------------------------------------------------------
+BREAKER_WINDOW = 20             # most recent calls considered
+BREAKER_WINDOW_SECS = 60.0      # ...and only those younger than this
+BREAKER_MIN_CALLS = 5           # don't judge an agent on fewer calls
+BREAKER_FAILURE_RATE = 0.5      # failed-or-slow fraction that opens the circuit
+BREAKER_SLOW_FACTOR = 3.0       # a success slower than this x its class p99 counts against the agent
+BREAKER_SLOW_MIN_MS = 1000.0    # ...but never one faster than this
+BREAKER_COOLDOWN = 10.0         # seconds open before a half-open trial call
+TIMEOUT_SAMPLES = 200           # latencies kept per call class for the p99 estimate
+LATENCY_CLASSES = 32            # call classes tracked per agent (least recently used dropped)
+TIMEOUT_MIN_SAMPLES = 20        # use DEFAULT_TIMEOUT until this many samples exist
+TIMEOUT_P99_FACTOR = 2.0        # attempt timeout = factor * observed p99
+MIN_TIMEOUT = 0.5
+FALLBACK_CACHE_SIZE = 1000      # last good answers kept for short-circuited calls
+
+BREAKERS: Dict[str, Dict[str, Any]] = {}
+LAST_GOOD: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+
+def breaker(agent: str) -> Dict[str, Any]:
+    state = BREAKERS.get(agent)
+    if state is None:
+        state = BREAKERS[agent] = {
+            "state": "closed",
+            "opened_at": 0.0,
+            "trial_in_flight": False,
+            "trial_started": 0.0,
+            "outcomes": deque(maxlen=BREAKER_WINDOW),      # (ts, failed)
+            "latencies": OrderedDict(),   # call class -> deque of successful call latencies, ms
+        }
+    return state
+
+def call_class(data: Optional[dict]) -> str:
+    """
+    Latency class of a /call body: its query / operation / cmd / mode, plus a
+    size bucket (~8x steps) for text inputs and a marker for streams. A short
+    summary and a map-reduce one are different classes, so neither skews the
+    other's timeout or slow threshold.
+    """
+    inp = (data or {}).get("input") or {}
+    name = next((str(inp[f]) for f in ("query", "operation", "cmd", "mode") if inp.get(f)), "*")
+    text = inp.get("text")
+    if isinstance(text, str):
+        name += f"/{len(text).bit_length() // 3}"
+    if inp.get("stream"):
+        name += "/stream"
+    return name
+
+def class_latencies(agent: str, cls: str) -> deque:
+    classes = breaker(agent)["latencies"]
+    lat = classes.get(cls)
+    if lat is None:
+        lat = classes[cls] = deque(maxlen=TIMEOUT_SAMPLES)
+        while len(classes) > LATENCY_CLASSES:
+            classes.popitem(last=False)
+    classes.move_to_end(cls)
+    return lat
+
+def _percentile(latencies, q: float) -> Optional[float]:
+    if not latencies:
+        return None
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def adaptive_timeout(agent: str, cls: str = "*", ceiling: float = DEFAULT_TIMEOUT) -> float:
+    """TIMEOUT_P99_FACTOR x the observed p99 of this call class, clamped to [MIN_TIMEOUT, ceiling]."""
+    lat = class_latencies(agent, cls)
+    if len(lat) < TIMEOUT_MIN_SAMPLES:
+        return ceiling
+    return max(MIN_TIMEOUT, min(ceiling, TIMEOUT_P99_FACTOR * _percentile(lat, 0.99) / 1000))
+
+def breaker_allows(agent: str) -> bool:
+    """Closed: allow. Open: reject until the cooldown ends, then let one trial through."""
+    state = breaker(agent)
+    if state["state"] == "closed":
+        return True
+    if state["state"] == "open" and time.time() - state["opened_at"] >= BREAKER_COOLDOWN:
+        state["state"] = "half_open"
+    # a trial that never reported back (cancelled caller) frees the slot after a cooldown
+    if state["state"] == "half_open" and (not state["trial_in_flight"]
+                                          or time.time() - state["trial_started"] >= BREAKER_COOLDOWN):
+        state["trial_in_flight"], state["trial_started"] = True, time.time()
+        return True
+    return False
+
+def slow_threshold_ms(agent: str, cls: str) -> Optional[float]:
+    """Latency above which a success of this class counts as slow; None until it has enough history."""
+    lat = class_latencies(agent, cls)
+    if len(lat) < TIMEOUT_MIN_SAMPLES:
+        return None
+    return max(BREAKER_SLOW_MIN_MS, BREAKER_SLOW_FACTOR * _percentile(lat, 0.99))
+
+def breaker_record(agent: str, failed: bool, latency_ms: float, cls: str = "*") -> None:
+    state = breaker(agent)
+    now = time.time()
+    threshold = slow_threshold_ms(agent, cls)
+    slow = threshold is not None and latency_ms > threshold
+    if not failed:
+        class_latencies(agent, cls).append(latency_ms)
+    if state["state"] == "half_open":
+        state["trial_in_flight"] = False
+        if failed or slow:
+            state["state"], state["opened_at"] = "open", now
+        else:
+            state["state"] = "closed"
+            state["outcomes"].clear()
+        return
+    state["outcomes"].append((now, failed or slow))
+    recent = [bad for ts, bad in state["outcomes"] if now - ts <= BREAKER_WINDOW_SECS]
+    if len(recent) >= BREAKER_MIN_CALLS and sum(recent) / len(recent) >= BREAKER_FAILURE_RATE:
+        state["state"], state["opened_at"] = "open", now
+        print(f"[hub] circuit opened for {agent}")
+
+def breaker_snapshot(agent: str) -> dict:
+    state = breaker(agent)
+    now = time.time()
+    recent = [bad for ts, bad in state["outcomes"] if now - ts <= BREAKER_WINDOW_SECS]
+    classes = {}
+    for cls, lat in list(state["latencies"].items()):
+        p99 = _percentile(lat, 0.99)
+        classes[cls] = {"p99_ms": round(p99, 2) if p99 is not None else None,
+                        "timeout": round(adaptive_timeout(agent, cls), 3)}
+    return {
+        "state": state["state"],
+        "failure_rate": round(sum(recent) / len(recent), 3) if recent else 0.0,
+        "calls": len(recent),
+        "classes": classes,
+    }
+
+def _fallback_key(agent: str, data: Optional[dict]) -> Tuple[str, str]:
+    return agent, json.dumps(data, sort_keys=True, default=str)
+
+def short_circuit(agent: str, data: Optional[dict], idempotent: bool) -> dict:
+    """Answer for a call rejected by an open circuit: last good result if safe, else an error."""
+    retry_after = max(0.0, BREAKER_COOLDOWN - (time.time() - breaker(agent)["opened_at"]))
+    cached = LAST_GOOD.get(_fallback_key(agent, data)) if idempotent else None
+    if cached is not None:
+        return {**cached, "stale": True, "circuit": "open"}
+    return {"error": f"circuit open for agent '{agent}'", "agent": agent, "circuit": "open",
+            "retry_after": round(retry_after, 2)}
+
+async def call_agent(agent: str, endpoint: str, data: Optional[dict] = None, timeout: float = DEFAULT_TIMEOUT,
+                     idempotent: bool = False, priority: str = "interactive") -> dict:
+    """
+    Call an agent HTTP endpoint through the shared async client, on the best
+    replica. Failed attempts move on to another replica within the original
+    `timeout` when that is safe (see _call_replica); each attempt is also capped
+    by the agent's adaptive timeout, whose ceiling is `timeout` when that is
+    longer than DEFAULT_TIMEOUT. While the agent's circuit is open the call
+    is short-circuited to the last good answer (idempotent calls) or an error.
+    Calls pass the agent's admission control first and may be shed with an
+    "overloaded" error (see AgentAdmission).
+    Returns a dict with either the JSON response or an error description.
+    """
+    if agent not in AGENTS:
+        return {"error": f"Agent '{agent}' not found"}
+    if not breaker_allows(agent):
+        return short_circuit(agent, data, idempotent)
+
+    started = time.perf_counter()
+    cls = call_class(data)
+    gate = admission(agent)
+    shed = await gate.acquire(priority, timeout)
+    if shed is not None:
+        return overloaded_error(agent, priority, shed)
+    admitted = time.perf_counter()
+    try:
+        tried: List[str] = []
+        result: dict = {}
+        retry: Optional[str] = None
+        while True:
+            remaining = timeout - (time.perf_counter() - started)
+            base_url = pick_replica(agent, tried)
+            if base_url is None or remaining < MIN_RETRY_BUDGET:
+                break
+            tried.append(base_url)
+            fair = adaptive_timeout(agent, cls)
+            # a caller that allows more than DEFAULT_TIMEOUT lifts the attempt cap with it
+            attempt_timeout = min(remaining, adaptive_timeout(agent, cls, max(timeout, DEFAULT_TIMEOUT)))
+            result, retry = await _call_replica(agent, base_url, endpoint, data, attempt_timeout,
+                                                caller_bound=attempt_timeout < fair)
+            if retry in (None, "deadline") or (retry == "idempotent" and not idempotent):
+                break
+    finally:
+        gate.release(time.perf_counter() - admitted)
+
+    if not tried:
+        breaker(agent)["trial_in_flight"] = False  # no attempt: free a half-open trial unjudged
+        return unattempted_error(agent, priority)
+    if retry == "deadline":
+        # the caller gave up early, which says nothing about the agent: free a
+        # half-open trial without judging it
+        breaker(agent)["trial_in_flight"] = False
+        return result
+    # 4xx answers (retry is None) mean the agent is working; only transport/5xx count
+    breaker_record(agent, retry is not None, (time.perf_counter() - admitted) * 1000, cls)
+    if retry is None and idempotent and "error" not in result:
+        key = _fallback_key(agent, data)
+        LAST_GOOD[key] = result
+        LAST_GOOD.move_to_end(key)
+        while len(LAST_GOOD) > FALLBACK_CACHE_SIZE:
+            LAST_GOOD.popitem(last=False)
+    return result
+
+# ------------------------------------------------------------
+# Request hedging (opt-in, read-only calls)
+# ------------------------------------------------------------
+HEDGE_PERCENTILE = 0.95         # hedge once the primary is slower than this percentile
+HEDGE_RATE = 0.1                # hedges allowed per hedge-eligible call, long run
+HEDGE_BURST = 5.0               # hedges allowed back to back before the rate applies
+
+HEDGE_BUDGET: Dict[str, float] = {}
+HEDGE_STATS: Dict[str, Dict[str, int]] = {}
+
+def hedge_delay(agent: str, cls: str = "*") -> Optional[float]:
+    """Seconds to wait before hedging this call class, or None while there's too little latency history."""
+    lat = class_latencies(agent, cls)
+    if len(lat) < TIMEOUT_MIN_SAMPLES:
+        return None
+    return _percentile(lat, HEDGE_PERCENTILE) / 1000
+
+def _take_hedge_token(agent: str) -> bool:
+    """Token bucket: each eligible call earns HEDGE_RATE, each hedge costs one token."""
+    tokens = HEDGE_BUDGET.get(agent, HEDGE_BURST)
+    if tokens >= 1.0:
+        HEDGE_BUDGET[agent] = tokens - 1.0
+        return True
+    return False
+
+async def hedged_call(agent: str, endpoint: str, data: Optional[dict] = None,
+                      timeout: float = DEFAULT_TIMEOUT, priority: str = "interactive") -> dict:
+    """
+    Idempotent call_agent that sends one duplicate request when the primary
+    hasn't answered within the agent's observed p95. The duplicate normally
+    lands on another replica since the primary is still outstanding on its own.
+    The first successful answer wins and the other request is cancelled.
+    Hedges are limited by a per-agent token bucket, so that a slow or failing
+    agent does not receive twice the load. They are also skipped unless the
+    agent's circuit is closed.
+    """
+    stats = HEDGE_STATS.setdefault(agent, {"calls": 0, "hedged": 0, "hedge_won": 0})
+    stats["calls"] += 1
+    HEDGE_BUDGET[agent] = min(HEDGE_BURST, HEDGE_BUDGET.get(agent, HEDGE_BURST) + HEDGE_RATE)
+
+    started = time.perf_counter()
+    primary = asyncio.ensure_future(call_agent(agent, endpoint, data, timeout, idempotent=True, priority=priority))
+    delay = hedge_delay(agent, call_class(data))
+    if delay is None:
+        return await primary
+    pending = {primary}
+    result: dict = {}
+    try:
+        # asyncio.wait doesn't cancel what it waits on; the finally does if our caller goes away
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or breaker(agent)["state"] != "closed" or not _take_hedge_token(agent):
+            return await primary
+
+        stats["hedged"] += 1
+        remaining = max(MIN_RETRY_BUDGET, timeout - (time.perf_counter() - started))
+        # the duplicate is optional work: background class, so admission sheds it first
+        hedge = asyncio.ensure_future(call_agent(agent, endpoint, data, remaining, idempotent=True,
+                                                 priority="background"))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if "error" not in result:
+                    if task is hedge:
+                        stats["hedge_won"] += 1
+                    return result
+        return result  # both failed: the last error is as good as any
+    finally:
+        for task in pending:
+            task.cancel()
+
+# ------------------------------------------------------------
+# Result cache (cacheable queries only)
+# ------------------------------------------------------------
+RESULT_CACHE_ENTRIES = int(os.environ.get("HUB_CACHE_ENTRIES", "10000"))
+RESULT_CACHE_BYTES = int(os.environ.get("HUB_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# agent -> query -> TTL seconds ("*" = any query). Only side-effect-free queries
+# whose answer is worth reusing belong here; health is live state, not cached.
+CACHEABLE_QUERIES: Dict[str, Dict[str, float]] = {
+    "data-agent": {"get_user": 30.0, "list_users": 30.0, "search": 30.0},
+    "math-agent": {"*": 300.0},
+}
+# agent -> write query -> cached queries of that agent it makes stale
+CACHE_INVALIDATIONS: Dict[str, Dict[str, set]] = {
+    "data-agent": {"insert": {"get_user", "list_users", "search"}},
+}
+
+def cache_ttl(agent: str, query: str) -> Optional[float]:
+    ttls = CACHEABLE_QUERIES.get(agent, {})
+    return ttls.get(query, ttls.get("*"))
+
+class LeaderCancelled(RuntimeError):
+    """The call a coalesced request was waiting on was cancelled; a waiter takes over."""
+
+class ResultCache:
+    """
+    TTL + LRU cache of agent results keyed by (agent, query, canonical input),
+    bounded by entry count and by the approximate JSON size of the results.
+    Concurrent identical misses share one agent call (single flight). Only
+    touched from the event loop, so no locking. Counters go to METRICS as
+    result_cache_<stat>_total, entries/bytes as result_cache_* gauges.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._mem: "OrderedDict[Tuple[str, str, str], Tuple[float, int, dict]]" = OrderedDict()
+        self._by_query: Dict[Tuple[str, str], set] = {}
+        self._generation: Dict[Tuple[str, str], int] = {}
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        self.stats[stat] += amount
+        METRICS.inc(f"result_cache_{stat}_total", amount)
+
+    def _gauges(self) -> None:
+        METRICS.gauge_set("result_cache_entries", len(self._mem))
+        METRICS.gauge_set("result_cache_bytes", self.bytes)
+
+    @staticmethod
+    def _shareable(result: dict) -> dict:
+        """The result without meta.trace, which belongs to the call that produced it."""
+        meta = result.get("meta")
+        if not isinstance(meta, dict) or "trace" not in meta:
+            return result
+        return {**result, "meta": {k: v for k, v in meta.items() if k != "trace"}}
+
+    @staticmethod
+    def key(agent: str, query: str, input_data: Any) -> Tuple[str, str, str]:
+        return agent, query, json.dumps(input_data, sort_keys=True, separators=(",", ":"), default=str)
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[dict]:
+        hit = self._mem.get(key)
+        if hit is None:
+            return None
+        if time.time() >= hit[0]:
+            self._drop(key)
+            self._gauges()
+            return None
+        self._mem.move_to_end(key)
+        return hit[2]
+
+    def put(self, key: Tuple[str, str, str], result: dict, ttl: float) -> None:
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._mem:
+            self._drop(key)
+        self._mem[key] = (time.time() + ttl, size, result)
+        self._by_query.setdefault(key[:2], set()).add(key)
+        self.bytes += size
+        while len(self._mem) > self.max_entries or self.bytes > self.max_bytes:
+            self._drop(next(iter(self._mem)))
+            self._count("evictions")
+        self._gauges()
+
+    def _drop(self, key: Tuple[str, str, str]) -> None:
+        _, size, _ = self._mem.pop(key)
+        self.bytes -= size
+        self._by_query.get(key[:2], set()).discard(key)
+
+    def invalidate(self, agent: str, queries) -> int:
+        """Drop every entry for the given queries; in-flight results for them won't be stored."""
+        dropped = 0
+        for query in queries:
+            self._generation[(agent, query)] = self._generation.get((agent, query), 0) + 1
+            for key in list(self._by_query.pop((agent, query), ())):
+                if key in self._mem:
+                    _, size, _ = self._mem.pop(key)
+                    self.bytes -= size
+                    dropped += 1
+        self._count("invalidations", dropped)
+        self._gauges()
+        return dropped
+
+    async def fetch(self, agent: str, query: str, input_data: Any, ttl: float, call) -> Tuple[dict, str]:
+        """
+        Cached result for the key, or the result of `call()` (stored unless it
+        is an error). Returns (result, "hit" | "miss" | "coalesced").
+        """
+        key = self.key(agent, query, input_data)
+        cached = self.get(key)
+        if cached is not None:
+            self._count("hits")
+            return cached, "hit"
+        # a leader whose MCP call was cancelled hands over to one of its waiters
+        while (pending := self._inflight.get(key)) is not None:
+            try:
+                result = await asyncio.shield(pending)
+            except LeaderCancelled:
+                continue
+            self._count("coalesced")
+            return result, "coalesced"
+
+        self._count("misses")
+        generation = self._generation.get(key[:2], 0)
+        pending = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await call()
+            shared = self._shareable(result)  # hits and followers are other calls, with other traces
+            if "error" not in result and self._generation.get(key[:2], 0) == generation:
+                self.put(key, shared, ttl)
+            pending.set_result(shared)
+            return result, "miss"
+        except BaseException as e:
+            pending.set_exception(e if isinstance(e, Exception) else LeaderCancelled())
+            pending.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "entries": len(self._mem), "bytes": self.bytes}
+
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_BYTES)
+
+async def call_through_cache(agent: str, query: str, call_payload: dict, call,
+                             use_cache: bool = True) -> Tuple[dict, Optional[str]]:
+    """
+    Run `call()` for one agent query, through RESULT_CACHE when the query is
+    cacheable, and apply the invalidations of write queries.
+    Returns (result, cache status or None when the cache wasn't consulted).
+    """
+    ttl = cache_ttl(agent, query)
+    if ttl is None or not use_cache:
+        result = await call()
+        stale = CACHE_INVALIDATIONS.get(agent, {}).get(query)
+        if stale:  # even a failed write may have landed
+            RESULT_CACHE.invalidate(agent, stale)
+        return result, None
+    return await RESULT_CACHE.fetch(agent, query, call_payload["input"], ttl, call)
+
+async def stream_agent(agent: str, endpoint: str, data: dict, timeout: float = DEFAULT_TIMEOUT,
+                       idempotent: bool = False, priority: str = "interactive") -> AsyncIterator[dict]:
+    """
+    POST to an agent endpoint that answers with NDJSON and yield each line as it
+    arrives, without buffering the whole body. Errors are yielded as {"error": ...}.
+    Streams go through the same circuit breaker, admission control and replica
+    failover as call_agent. A failed attempt moves to another replica only
+    while nothing has been yielded yet. `timeout` bounds the whole stream, not
+    just the gap between chunks.
+    """
+    if agent not in AGENTS:
+        yield {"error": f"Agent '{agent}' not found"}
+        return
+    if not breaker_allows(agent):
+        yield short_circuit(agent, None, False)  # a stream has no last good answer to fall back to
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    cls = call_class(data)
+    gate = admission(agent)
+    shed = await gate.acquire(priority, timeout)
+    if shed is not None:
+        yield overloaded_error(agent, priority, shed)
+        return
+
+    admitted = time.perf_counter()
+    tried: List[str] = []
+    error: Optional[dict] = None
+    retry: Optional[str] = None         # as in call_agent
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            base_url = pick_replica(agent, tried)
+            if base_url is None or remaining < MIN_RETRY_BUDGET:
+                break
+            tried.append(base_url)
+            caller_bound = remaining < adaptive_timeout(agent, cls)
+            state = replica_state(base_url)
+            url = f"{base_url}/{endpoint.lstrip('/')}"
+            # not made the current span: a generator's context belongs to its consumer
+            span = TRACER.start_span(f"stream {agent}", replica=base_url, endpoint=endpoint)
+            state["outstanding"] += 1
+            yielded = 0
+            try:
+                client = get_http_client()
+                async with _agent_slot(base_url):
+                    body = traced_payload(data, span, remaining)
+                    async with client.stream("POST", url, json=body, timeout=remaining) as resp:
+                        span.attrs["status"] = resp.status_code
+                        if resp.status_code >= 400:
+                            await resp.aread()
+                            error = {"error": f"HTTP {resp.status_code} from {url}", "agent": agent}
+                            retry = "idempotent" if resp.status_code >= 500 else None
+                            if resp.status_code == 504 and caller_bound and "deadline" in resp.text:
+                                retry = "deadline"
+                        else:
+                            # the deadline only wraps our own awaits: a timeout scope left open
+                            # across a yield would cancel whatever the consumer is awaiting
+                            lines = resp.aiter_lines()
+                            while True:
+                                async with asyncio.timeout_at(deadline):
+                                    line = await anext(lines, None)
+                                if line is None:
+                                    break
+                                if line.strip():
+                                    yielded += 1
+                                    yield json.loads(line)
+                            error, retry = None, None
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                state["down_until"] = time.time() + REPLICA_COOLDOWN
+                error, retry = {"error": str(e) or type(e).__name__, "agent": agent}, "connect"
+            except (TimeoutError, httpx.TimeoutException):
+                error = {"error": f"deadline exceeded streaming from {url}", "agent": agent}
+                retry = "deadline" if caller_bound else "idempotent"
+            except httpx.TransportError as e:
+                state["down_until"] = time.time() + REPLICA_COOLDOWN
+                error, retry = {"error": str(e) or type(e).__name__, "agent": agent}, "idempotent"
+            except Exception as e:
+                error, retry = {"error": str(e), "agent": agent}, None
+            finally:
+                state["outstanding"] -= 1
+                if error is not None:
+                    span.attrs.update(error=error["error"], retry=retry)
+                TRACER.end_span(span)
+            if yielded or retry in (None, "deadline") or (retry == "idempotent" and not idempotent):
+                break
+    finally:
+        gate.release(time.perf_counter() - admitted)
+
+    if not tried:
+        breaker(agent)["trial_in_flight"] = False  # see call_agent
+        yield unattempted_error(agent, priority)
+        return
+    if retry == "deadline":
+        breaker(agent)["trial_in_flight"] = False  # see call_agent
+    else:
+        breaker_record(agent, retry is not None, (time.perf_counter() - admitted) * 1000, cls)
+    if error is not None:
+        yield error
+
+async def relay_stream(ctx: Optional[Context], agent: str, call_payload: dict,
+                       rows_per_notification: int = STREAM_RELAY_ROWS, timeout: float = DEFAULT_TIMEOUT,
+                       idempotent: bool = False, priority: str = "interactive") -> dict:
+    """
+    Forward an agent's NDJSON stream to the MCP client as progress notifications,
+    `rows_per_notification` lines each (the message is the NDJSON chunk).
+    Only the trailing {"end": ...} line is kept, so hub memory stays bounded
+    by one chunk however large the result is.
+    """
+    relayed, chunk, end = 0, [], None
+
+    async def flush() -> None:
+        if ctx is not None and chunk:
+            await ctx.report_progress(progress=relayed, message="\n".join(json.dumps(c) for c in chunk))
+        chunk.clear()
+
+    # aclosing: returning early must release the agent's admission slot now, not at GC
+    async with aclosing(stream_agent(agent, "call", call_payload, timeout, idempotent, priority)) as lines:
+        async for line in lines:
+            if "error" in line:
+                await flush()
+                return {**line, "agent": agent, "streamed": relayed}
+            if "end" in line:
+                end = line["end"]
+                continue
+            chunk.append(line)
+            relayed += 1
+            if len(chunk) >= rows_per_notification:
+                await flush()
+    await flush()
+    return {"status": "ok", "agent": agent, "streamed": relayed, "end": end}
+
+async def _timed_health(agent: str, base_url: str, timeout: float, caller_bound: bool = False) -> dict:
+    """
+    Fetch one replica's /health and attach the measured latency. A caller-bound
+    probe that runs out of time reports {"status": "timeout"} like a cancelled one.
+    """
+    started = time.perf_counter()
+    result, retry = await _call_replica(agent, base_url, "health", None, timeout, caller_bound)
+    result = {"status": "timeout", "agent": agent} if retry == "deadline" else dict(result)
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+async def probe_all(agents: List[str], deadline: float = HEALTH_DEADLINE,
+                    judge_timeouts: bool = True) -> Dict[str, dict]:
+    """
+    Probe /health on every replica of every agent concurrently under one total
+    deadline. Replicas that have not answered when the deadline expires are
+    cancelled and reported as {"status": "timeout"} with the time spent waiting
+    on them, so the cost of the call is bounded by the deadline rather than the
+    number of agents. Each agent's result is its first healthy replica's (agents
+    with several replicas also get a per-replica "replicas" map), and replica
+    health is recorded for the router (timeouts only when `judge_timeouts`).
+    """
+    started = time.perf_counter()
+    tasks = {asyncio.ensure_future(_timed_health(a, url, deadline, not judge_timeouts)): (a, url)
+             for a in agents for url in agent_endpoints(a)}
+    if not tasks:
+        return {a: {"error": f"Agent '{a}' not found"} for a in agents}
+    try:
+        done, pending = await asyncio.wait(tasks.keys(), timeout=deadline)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    waited_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    per_replica: Dict[Tuple[str, str], dict] = {}
+    for task in pending:
+        task.cancel()
+        per_replica[tasks[task]] = {"status": "timeout", "agent": tasks[task][0], "latency_ms": waited_ms}
+    for task in done:
+        per_replica[tasks[task]] = task.result()
+
+    results: Dict[str, dict] = {}
+    for agent in agents:  # keep the registry order stable for callers
+        replicas = {url: per_replica[(agent, url)] for url in agent_endpoints(agent)}
+        for url, res in replicas.items():
+            if judge_timeouts or res.get("status") != "timeout":
+                replica_state(url)["healthy"] = "error" not in res and res.get("status") != "timeout"
+        healthy = [r for u, r in replicas.items() if REPLICAS[u]["healthy"]]
+        result = dict(healthy[0] if healthy else next(iter(replicas.values())))
+        if len(replicas) > 1:
+            result["replicas"] = {u: {"status": "ok" if REPLICAS[u]["healthy"] else r.get("status", "down"),
+                                      "latency_ms": r.get("latency_ms")} for u, r in replicas.items()}
+        results[agent] = result
+    return results
+
+# ------------------------------------------------------------
+# Health registry - refreshed in the background by health_prober()
+# ------------------------------------------------------------
+PROBE_INTERVAL = float(os.environ.get("HUB_PROBE_INTERVAL", "5.0"))  # seconds between probe rounds
+LATENCY_WINDOW = 20     # probes kept for the rolling latency average
+
+REGISTRY: Dict[str, Dict[str, Any]] = {}
+
+def _registry_entry(agent: str) -> Dict[str, Any]:
+    entry = REGISTRY.get(agent)
+    if entry is None:
+        entry = REGISTRY[agent] = {
+            "status": "unknown",
+            "last_seen": None,       # ts of the last successful probe
+            "last_probe": None,      # ts of the last probe, successful or not
+            "failures": 0,           # consecutive failed probes
+            "error": None,
+            "cpu": None,
+            "memory": None,
+            "latencies": deque(maxlen=LATENCY_WINDOW),
+        }
+    return entry
+
+def record_health(agent: str, result: dict) -> None:
+    """Fold one /health probe result into the registry."""
+    entry = _registry_entry(agent)
+    now = time.time()
+    entry["last_probe"] = now
+    if "latency_ms" in result:
+        entry["latencies"].append(result["latency_ms"])
+    if "error" in result or result.get("status") == "timeout":
+        entry["status"] = "down"
+        entry["failures"] += 1
+        entry["error"] = result.get("error") or "health probe timed out"
+        return
+    entry["status"] = result.get("status", "ok")
+    entry["last_seen"] = now
+    entry["failures"] = 0
+    entry["error"] = None
+    # health-agent reports system metrics; other agents leave these as None
+    entry["cpu"] = result.get("cpu", entry["cpu"])
+    entry["memory"] = result.get("memory", entry["memory"])
+
+def registry_snapshot(agent: str) -> dict:
+    """JSON-friendly view of one registry entry."""
+    entry = _registry_entry(agent)
+    lat = entry["latencies"]
+    snap = {k: v for k, v in entry.items() if k != "latencies"}
+    snap["agent"] = agent
+    snap["latency_ms"] = lat[-1] if lat else None
+    snap["latency_avg_ms"] = round(sum(lat) / len(lat), 2) if lat else None
+    return snap
+
+def down_error(agent: str) -> Optional[dict]:
+    """
+    Fail-fast check used before forwarding a call: returns an error dict if the
+    last background probe found the agent unreachable, otherwise None.
+    """
+    entry = REGISTRY.get(agent)
+    if entry is None or entry["status"] != "down":
+        return None
+    return {"error": f"Agent '{agent}' is down: {entry['error']}", "agent": agent,
+            "last_seen": entry["last_seen"]}
+
+async def refresh_registry(deadline: float = HEALTH_DEADLINE, judge_timeouts: bool = True) -> Dict[str, dict]:
+    """
+    Probe every agent live and record the results. With judge_timeouts=False
+    (a caller-shortened deadline) probes that merely timed out leave the
+    registry and replica routing untouched; errors are still recorded.
+    """
+    results = await probe_all(list(AGENTS.keys()), deadline, judge_timeouts)
+    for agent, result in results.items():
+        if judge_timeouts or result.get("status") != "timeout":
+            record_health(agent, result)
+    return results
+
+async def health_prober(interval: float = PROBE_INTERVAL) -> None:
+    """Background loop keeping REGISTRY fresh."""
+    while True:
+        try:
+            await refresh_registry(min(HEALTH_DEADLINE, interval))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[hub] health probe round failed: {e}")
+        await asyncio.sleep(interval)
+
+def caller_timeout(payload: dict) -> Union[float, dict]:
+    """
+    The caller's deadline for this tool call in seconds: payload "timeout",
+    clamped to MAX_CALL_TIMEOUT, else DEFAULT_TIMEOUT. It bounds the whole call,
+    retries and hedges included, and reaches the agent as meta.deadline.
+    Returns an error dict for a malformed value.
+    """
+    return seconds_param(payload, "timeout", DEFAULT_TIMEOUT, MAX_CALL_TIMEOUT)
+
+def seconds_param(payload: dict, key: str, default: float, cap: float) -> Union[float, dict]:
+    """payload[key] as a positive, finite number of seconds clamped to `cap`, or an error dict."""
+    raw = payload.get(key)
+    if raw is None:
+        return default
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        return {"error": f"{key} must be a number of seconds"}
+    if not math.isfinite(value) or value <= 0:
+        return {"error": f"{key} must be a positive, finite number of seconds"}
+    return min(value, cap)
+
+def caller_priority(payload: dict, default: str = "interactive") -> Union[str, dict]:
+    """Admission class for this call: payload "priority", one of PRIORITIES."""
+    priority = payload.get("priority") or default
+    if priority not in PRIORITIES:
+        return {"error": f"priority must be one of {', '.join(PRIORITIES)}"}
+    return priority
+
+def build_call_payload(query: str, input_data: Any) -> dict:
+    """Build the MCP-style {"input": {...}} body an agent's /call expects."""
+    call_payload = {"input": {"query": query}}
+    if isinstance(input_data, dict):
+        call_payload["input"].update(input_data)
+    return call_payload
 
 # ------------------------------------------------------------
-# Tools implemented as plain functions (accept generic payloads)
+# Capability routing - inverted keyword index over declared capabilities
 # ------------------------------------------------------------
-def list_agents_tool(payload: Optional[dict] = None) -> dict:
-    """Return the registered agents and their base URLs."""
-    return {"status": "ok", "agents": AGENTS, "ts": time.time()}
+# Each agent declares what it can do: capability name -> the /call input field
+# that selects it ("query", "operation" or "cmd") and extra keywords.
+CAPABILITIES: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "finance-agent": {
+        "finance_report": {"field": "query", "keywords": ["finance", "budget", "revenue", "expenses", "profit"]},
+    },
+    "data-agent": {
+        "get_user": {"field": "query", "keywords": ["user", "get", "lookup", "id", "fetch"]},
+        "list_users": {"field": "query", "keywords": ["list", "users", "all"]},
+        "search": {"field": "query", "keywords": ["search", "find", "name", "email", "role"]},
+        "insert": {"field": "query", "keywords": ["insert", "create", "new", "user"]},
+    },
+    "math-agent": {
+        "add": {"field": "operation", "keywords": ["plus", "addition"]},
+        "sub": {"field": "operation", "keywords": ["minus", "subtract", "difference"]},
+        "mul": {"field": "operation", "keywords": ["times", "multiply", "product"]},
+        "div": {"field": "operation", "keywords": ["divide", "quotient", "ratio"]},
+        "percent": {"field": "operation", "keywords": ["percentage", "share"]},
+        "avg": {"field": "operation", "keywords": ["average", "mean"]},
+        "sum": {"field": "operation", "keywords": ["total"]},
+        "min": {"field": "operation", "keywords": ["minimum", "smallest", "lowest"]},
+        "max": {"field": "operation", "keywords": ["maximum", "largest", "highest"]},
+        "var": {"field": "operation", "keywords": ["variance"]},
+        "std": {"field": "operation", "keywords": ["deviation", "stddev"]},
+        "median": {"field": "operation", "keywords": ["middle"]},
+        "percentile": {"field": "operation", "keywords": ["quantile", "p95", "p99"]},
+        "dot": {"field": "operation", "keywords": ["vector", "inner"]},
+        "batch": {"field": "operation", "keywords": ["bulk"]},
+    },
+    "health-agent": {
+        "status": {"field": "cmd", "keywords": ["health", "cpu", "memory", "load", "system"]},
+    },
+    "summarizer-gemini": {
+        "summarize": {"field": "query", "keywords": ["summary", "summarise", "tldr", "condense", "text"]},
+    },
+}
+ROUTE_CACHE_SIZE = 4096
+
+CAPABILITY_INDEX: Dict[str, List[Tuple[str, str]]] = {}   # token -> [(agent, capability)]
+CAPABILITY_NAMES: Dict[str, List[Tuple[str, str]]] = {}   # capability -> [(agent, capability)]
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9_]+", text.lower())
 
-def health_all_tool(payload: Optional[dict] = None) -> dict:
-    """Query /health on all agents and return aggregated results."""
-    results: Dict[str, Any] = {}
-    for name in AGENTS.keys():
-        results[name] = call_agent_sync(name, "health")
-    return {"status": "ok", "timestamp": time.time(), "results": results}
+def rebuild_capability_index() -> None:
+    """(Re)build the inverted index from CAPABILITIES and drop memoized routes."""
+    CAPABILITY_INDEX.clear()
+    CAPABILITY_NAMES.clear()
+    for agent, caps in CAPABILITIES.items():
+        for name, spec in caps.items():
+            entry = (agent, name)
+            CAPABILITY_NAMES.setdefault(name, []).append(entry)
+            for token in {name, *name.split("_"), *spec.get("keywords", [])}:
+                postings = CAPABILITY_INDEX.setdefault(token, [])
+                if entry not in postings:
+                    postings.append(entry)
+    _resolve_text.cache_clear()
+
+def _route_key(text: str) -> str:
+    """The indexed words of `text`, deduplicated and sorted: what scoring depends on, and the cache key."""
+    return " ".join(sorted({t for t in _tokens(text) if t in CAPABILITY_INDEX}))
+
+@lru_cache(maxsize=ROUTE_CACHE_SIZE)
+def _resolve_text(key: str) -> Tuple[Tuple[str, str, float], ...]:
+    """
+    Score (agent, capability) pairs for a route key (see _route_key). Each
+    matching token adds 1/len(postings), so rare, specific words outweigh
+    generic ones, and naming the capability itself adds a bonus.
+    """
+    scores: Dict[Tuple[str, str], float] = {}
+    for token in key.split():
+        postings = CAPABILITY_INDEX[token]
+        weight = 1.0 / len(postings)
+        for entry in postings:
+            bonus = 1.0 if token == entry[1] else 0.0
+            scores[entry] = scores.get(entry, 0.0) + weight + bonus
+    ranked = sorted(scores.items(), key=lambda kv: -kv[1])
+    return tuple((agent, cap, round(score, 3)) for (agent, cap), score in ranked)
 
-def call_agent_tool(payload: Optional[dict]) -> dict:
+def resolve_route(request: Any, limit: int = 3) -> List[dict]:
+    """
+    Resolve a request to candidate agents.
+      structured: {"capability"|"query"|"operation"|"cmd": name} -> exact lookup,
+                  else that value scored through the keyword index; other
+                  fields (e.g. a "text" payload) are never routed on
+      free text:  "what is the average of ..." -> inverted-index scoring
+    Candidates come back best first; among equal scores, agents the registry
+    does not know to be down come first.
+    """
+    if isinstance(request, dict):
+        name = next((request[k] for k in ("capability", "query", "operation", "cmd") if request.get(k)), None)
+        if name is None:
+            return []
+        ranked = [(a, c, 1.0) for a, c in CAPABILITY_NAMES.get(str(name), [])]
+        if not ranked:
+            ranked = list(_resolve_text(_route_key(str(name))))
+    else:
+        ranked = list(_resolve_text(_route_key(str(request))))
+    ranked.sort(key=lambda r: (-r[2], down_error(r[0]) is not None))
+    return [{"agent": a, "capability": c, "field": CAPABILITIES[a][c]["field"], "score": sc}
+            for a, c, sc in ranked[:limit]]
+
+rebuild_capability_index()
+
+# ------------------------------------------------------------
+# Tools implemented as coroutines (accept generic payloads)
+# ------------------------------------------------------------
+async def list_agents_tool(payload: Optional[dict] = None) -> dict:
+    """Return the registered agents, their base URLs, per-replica routing, circuit, admission, hedging and cache state."""
+    replicas = {url: {k: v for k, v in replica_state(url).items() if k != "down_until"}
+                for a in AGENTS for url in agent_endpoints(a)}
+    circuits = {a: breaker_snapshot(a) for a in AGENTS}
+    return {"status": "ok", "agents": AGENTS, "replicas": replicas, "circuits": circuits,
+            "admission": {a: admission(a).snapshot() for a in AGENTS}, "hedging": HEDGE_STATS, "cache": RESULT_CACHE.snapshot(), "ts": time.time()}
+
+async def health_all_tool(payload: Optional[dict] = None) -> dict:
+    """
+    Return the health of all agents from the background registry.
+    Optional payload:
+      {"fresh": true}      — probe every agent live (and update the registry)
+      {"deadline": secs}   — total budget for a live fan-out
+    A live probe is also used until the prober has completed its first round.
+    """
+    payload = payload if isinstance(payload, dict) else {}
+    deadline = seconds_param(payload, "deadline", HEALTH_DEADLINE, MAX_HEALTH_DEADLINE)
+    if isinstance(deadline, dict):
+        return deadline
+
+    warm = all(REGISTRY.get(a, {}).get("last_probe") for a in AGENTS)
+    if payload.get("fresh") or not warm:
+        # a budget shorter than the prober's says nothing about agents that run out of it
+        results = await refresh_registry(deadline, judge_timeouts=deadline >= HEALTH_DEADLINE)
+        return {"status": "ok", "timestamp": time.time(), "source": "live", "results": results}
+
+    results = {a: registry_snapshot(a) for a in AGENTS}
+    return {"status": "ok", "timestamp": time.time(), "source": "registry", "results": results}
+
+async def call_agent_tool(payload: Optional[dict], ctx: Optional[Context] = None) -> dict:
     """
     Generic tool to call another agent's /call endpoint.
     Expected payload format (flexible):
@@ -74,6 +1347,24 @@ def call_agent_tool(payload: Optional[dict]) -> dict:
         "query": "some_query_name",
         "input": { ... }   # optional
       }
+    If "agent" is omitted, the query (or input.operation / input.cmd) is
+    resolved through the capability index and sent to the best candidate.
+    With input.stream = true (e.g. data-agent list_users/search) the agent's
+    NDJSON rows are relayed as MCP progress notifications while they arrive
+    and the result only carries the row count and the agent's end record.
+    With "hedge": true a read-only query gets a duplicate request when the
+    first one is slower than the agent's p95 (see hedged_call); it is ignored
+    for queries that aren't idempotent.
+    Queries listed in CACHEABLE_QUERIES are answered from the hub's result
+    cache when possible ("cache": false skips it); writes listed in
+    CACHE_INVALIDATIONS drop the entries they make stale.
+    The result carries the call's trace_id; see hub_traces.
+    "timeout" (seconds, default 15) is the caller's deadline: the agent gets it
+    as meta.deadline and stops working on the call once it passes; cancelling
+    the MCP request closes the agent connection, which cancels the agent's work.
+    "priority" is "interactive" (default) or "background". When the agent is
+    backed up the hub answers {"error": "overloaded", ...} right away, and it
+    sheds background calls first (see AgentAdmission).
     """
     if not payload or not isinstance(payload, dict):
         return {"error": "payload must be an object with agent and query keys"}
@@ -82,22 +1373,186 @@ def call_agent_tool(payload: Optional[dict]) -> dict:
     query = payload.get("query")
     input_data = payload.get("input", {})
 
+    if not agent:
+        structured = dict(input_data) if isinstance(input_data, dict) else {}
+        if query:
+            structured["query"] = query
+        candidates = resolve_route(structured, limit=1)
+        if not candidates:
+            return {"error": "agent is required in payload (no registered agent handles this query)"}
+        agent, field = candidates[0]["agent"], candidates[0]["field"]
+        if field == "query" or not query:
+            query = candidates[0]["capability"]  # "tldr" -> the agent's "summarize"
+        if field != "query" and isinstance(input_data, dict):
+            input_data = {field: candidates[0]["capability"], **input_data}
+
     if not agent or not query:
         return {"error": "agent and query are required in payload"}
+    down = down_error(agent)
+    if down:
+        return down
 
-    # build MCP-style call payload for agent
-    call_payload = {"input": {"query": query}}
-    if isinstance(input_data, dict):
-        call_payload["input"].update(input_data)
+    timeout = caller_timeout(payload)
+    if isinstance(timeout, dict):
+        return timeout
+    priority = caller_priority(payload)
+    if isinstance(priority, dict):
+        return priority
+    call_payload = build_call_payload(query, input_data)
+    if call_payload["input"].get("stream"):
+        return await relay_stream(ctx, agent, call_payload, timeout=timeout,
+                                  idempotent=is_idempotent(agent, query), priority=priority)
+
+    idempotent = is_idempotent(agent, query)
+
+    async def call() -> dict:
+        if payload.get("hedge") and idempotent:
+            return await hedged_call(agent, "call", call_payload, timeout, priority=priority)
+        return await call_agent(agent, "call", call_payload, timeout, idempotent=idempotent, priority=priority)
+
+    result, cache_status = await call_through_cache(agent, query, call_payload, call,
+                                                    use_cache=payload.get("cache") is not False)
+    out = {"status": "ok", "agent": agent, "result": result}
+    if cache_status is not None:
+        out["cache"] = cache_status
+    span = TRACER.current()
+    if span is not None:
+        out["trace_id"] = span.trace_id
+    return out
+
+async def route_request_tool(payload: Optional[dict]) -> dict:
+    """
+    Resolve a request to candidate agents without calling them.
+    Accepts {"text": "free text request"} or a structured
+    {"capability"|"query"|"operation"|"cmd": name}; optional "limit" (default 3).
+    """
+    if not payload or not isinstance(payload, dict):
+        return {"error": "payload must be an object with text or a capability name"}
+    try:
+        limit = int(payload.get("limit") or 3)
+    except (TypeError, ValueError):
+        return {"error": "limit must be an integer"}
+    request = {k: v for k, v in payload.items() if k != "limit"}
+    if set(request) == {"text"}:
+        request = request["text"]
+    return {"status": "ok", "candidates": resolve_route(request, limit)}
+
+async def call_agents_batch_tool(payload: Optional[dict]) -> dict:
+    """
+    Run many agent calls in one MCP round trip.
+    Expected payload format:
+      {
+        "items": [
+          {"agent": "math-agent", "query": "add", "input": {...}},
+          {"agent": "data-agent", "query": "get_user", "input": {"id": 1}},
+          ...
+        ],
+        "concurrency": 4,  # optional per-agent cap for this batch
+        "priority": "background"  # default; "interactive" to compete with single calls
+      }
+    Items are dispatched concurrently and results come back in the same order,
+    each with its own status; one failing item never aborts the others.
+    Cacheable queries go through the hub result cache like call_agent does.
+    Items an overloaded agent sheds fail with "overloaded".
+    """
+    if not payload or not isinstance(payload, dict):
+        return {"error": "payload must be an object with an items list"}
+
+    items = payload.get("items")
+    if not isinstance(items, list) or not items:
+        return {"error": "items must be a non-empty list"}
+    if len(items) > MAX_BATCH_ITEMS:
+        return {"error": f"batch too large: {len(items)} items (max {MAX_BATCH_ITEMS})"}
+    try:
+        concurrency = int(payload.get("concurrency") or BATCH_AGENT_CONCURRENCY)
+    except (TypeError, ValueError):
+        return {"error": "concurrency must be an integer"}
+    concurrency = max(1, min(concurrency, AGENT_MAX_CONNECTIONS))
+    priority = caller_priority(payload, default="background")
+    if isinstance(priority, dict):
+        return priority
+
+    slots: Dict[str, asyncio.Semaphore] = {}
+
+    async def run_item(index: int, item: Any) -> dict:
+        if not isinstance(item, dict) or not item.get("agent") or not item.get("query"):
+            return {"index": index, "status": "error", "error": "agent and query are required in each item"}
+        agent = item["agent"]
+        down = down_error(agent)
+        if down:
+            return {"index": index, "agent": agent, "status": "error", "error": down["error"]}
+        slot = slots.setdefault(agent, asyncio.Semaphore(concurrency))
+        call_payload = build_call_payload(item["query"], item.get("input", {}))
+
+        async def call() -> dict:
+            async with slot:
+                return await call_agent(agent, "call", call_payload, idempotent=is_idempotent(agent, item["query"]),
+                                        priority=priority)
 
-    result = call_agent_sync(agent, "call", call_payload)
-    return {"status": "ok", "agent": agent, "result": result}
+        result, _ = await call_through_cache(agent, item["query"], call_payload, call)
+        if "error" in result:
+            return {"index": index, "agent": agent, "status": "error", "error": result["error"]}
+        return {"index": index, "agent": agent, "status": "ok", "result": result}
 
-def summarize_with_gemini_tool(payload: Optional[dict]) -> dict:
+    outcomes = await asyncio.gather(*(run_item(i, it) for i, it in enumerate(items)), return_exceptions=True)
+    results = []
+    for i, outcome in enumerate(outcomes):
+        if isinstance(outcome, BaseException):
+            outcome = {"index": i, "status": "error", "error": str(outcome)}
+        results.append(outcome)
+    failed = sum(1 for r in results if r["status"] != "ok")
+    return {"status": "ok", "count": len(results), "failed": failed, "results": results}
+
+async def hub_metrics_tool(payload: Optional[dict] = None) -> dict:
+    """
+    Hub metrics as JSON: tool latencies, per-agent call outcomes and
+    histograms, and a round_trip / agent / network breakdown per agent
+    endpoint. With {"format": "prometheus"} the text exposition is returned
+    instead (the same text GET /metrics serves on HTTP transports).
+    """
+    if isinstance(payload, dict) and payload.get("format") == "prometheus":
+        return {"status": "ok", "text": METRICS.render()}
+    return {"status": "ok", "metrics": METRICS.snapshot(), "breakdown": time_breakdown(),
+            "cache": RESULT_CACHE.snapshot(), "ts": time.time()}
+
+async def hub_traces_tool(payload: Optional[dict] = None) -> dict:
+    """
+    Look up traces recorded by the hub. {"trace_id": id} returns the trace's
+    spans (hub tool call, every agent attempt, and the span each agent
+    reported with its parse/handler/serialize timings) plus its critical path.
+    Without a trace_id, the slowest recent tool calls are returned
+    ({"limit": n}, default 10).
+    """
+    payload = payload if isinstance(payload, dict) else {}
+    trace_id = payload.get("trace_id")
+    if trace_id:
+        spans = TRACER.trace(str(trace_id))
+        if not spans:
+            return {"error": f"trace '{trace_id}' not found (expired from the buffer?)"}
+        return {"status": "ok", "trace_id": trace_id, "spans": spans, "critical_path": critical_path(spans)}
+    try:
+        limit = int(payload.get("limit") or 10)
+    except (TypeError, ValueError):
+        return {"error": "limit must be an integer"}
+    slowest = [{"trace_id": root["trace_id"], "name": root["name"], "duration_ms": root["duration_ms"],
+                "critical_path": critical_path(TRACER.trace(root["trace_id"]))}
+               for root in TRACER.slowest(limit)]
+    return {"status": "ok", "slowest": slowest}
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+async def summarize_with_gemini_tool(payload: Optional[dict], ctx: Optional[Context] = None) -> dict:
     """
     Convenience wrapper that calls the summarizer agent's /call endpoint.
     Accepts payload like:
       {"text": "..."}  OR  {"input": {"text": "..."}}  OR same shape as call_agent_tool
+    An optional "mode" ("auto", "long", "short") selects the agent's long-document path.
+    With "stream": true each piece of the summary is forwarded as an MCP progress
+    notification as soon as the model produces it. "timeout" works as in
+    call_agent_tool; the summarizer abandons the model call when it expires.
+    "priority" works as in call_agent_tool.
     """
     if not payload or not isinstance(payload, dict):
         return {"error": "payload must be an object containing text"}
@@ -111,8 +1566,28 @@ def summarize_with_gemini_tool(payload: Optional[dict]) -> dict:
     if not text:
         return {"error": "text required (payload.text or payload.input.text)"}
 
+    down = down_error("summarizer-gemini")
+    if down:
+        return down
+
     agent_payload = {"input": {"text": text}}
-    result = call_agent_sync("summarizer-gemini", "call", agent_payload)
+    mode = payload.get("mode") or (payload.get("input") or {}).get("mode")
+    if mode:
+        agent_payload["input"]["mode"] = mode
+    timeout = caller_timeout(payload)
+    if isinstance(timeout, dict):
+        return timeout
+    priority = caller_priority(payload)
+    if isinstance(priority, dict):
+        return priority
+    if payload.get("stream") or (payload.get("input") or {}).get("stream"):
+        agent_payload["input"]["stream"] = True
+        result = await relay_stream(ctx, "summarizer-gemini", agent_payload, rows_per_notification=1,
+                                    timeout=timeout, priority=priority,
+                                    idempotent=is_idempotent("summarizer-gemini", "summarize"))
+        return {"status": "ok", "summary": result}
+    result = await call_agent("summarizer-gemini", "call", agent_payload, timeout,
+                              idempotent=is_idempotent("summarizer-gemini", "summarize"), priority=priority)
     return {"status": "ok", "summary": result}
 
 # ------------------------------------------------------------
@@ -129,6 +1604,18 @@ health_all_tool.description = "Get /health from all agents"
 call_agent_tool.key = "call_agent_tool"
 call_agent_tool.description = "Proxy a call to a specific agent's /call endpoint"
 
+route_request_tool.key = "route_request"
+route_request_tool.description = "Resolve a free-text or structured request to candidate agents"
+
+call_agents_batch_tool.key = "call_agents_batch"
+call_agents_batch_tool.description = "Run many agent /call requests concurrently in one round trip"
+
+hub_metrics_tool.key = "hub_metrics"
+hub_metrics_tool.description = "Hub latency/throughput metrics and a per-agent time breakdown"
+
+hub_traces_tool.key = "hub_traces"
+hub_traces_tool.description = "Spans and critical path of a traced call, or the slowest recent calls"
+
 summarize_with_gemini_tool.key = "summarize_with_gemini"
 summarize_with_gemini_tool.description = "Summarize text via the Gemini summarizer agent"
 
@@ -139,7 +1626,12 @@ summarize_with_gemini_tool.description = "Summarize text via the Gemini summariz
 mcp.add_tool(list_agents_tool)
 mcp.add_tool(health_all_tool)
 mcp.add_tool(call_agent_tool)
+mcp.add_tool(call_agents_batch_tool)
+mcp.add_tool(route_request_tool)
 mcp.add_tool(summarize_with_gemini_tool)
+mcp.add_tool(hub_metrics_tool)
+mcp.add_tool(hub_traces_tool)
+mcp.add_middleware(ToolMetrics())
 
 # ------------------------------------------------------------
 # Start message and run
@@ -147,9 +1639,9 @@ mcp.add_tool(summarize_with_gemini_tool)
 if __name__ == "__main__":
     print("\n🚀 MCP Central Hub (manual registration) starting.")
     print("🔗 Connected agents:")
-    for a, url in AGENTS.items():
-        print(f"  - {a}: {url}")
-    print("✅ Registered tools: list_agents, health_all, call_agent_tool, summarize_with_gemini\n")
+    for a in AGENTS:
+        print(f"  - {a}: {', '.join(agent_endpoints(a))}")
+    print("✅ Registered tools: list_agents, health_all, call_agent_tool, call_agents_batch, route_request, summarize_with_gemini, hub_metrics, hub_traces\n")
 
     # run the MCP server (blocking)
     mcp.run()
@@ -0,0 +1,227 @@
+"""
+status_bus.py — local pub/sub status bus over a Unix socket.
+
+Replaces the agent_status.json / finance_data.json polling loops: publishers push
+changes to a small broker, and the broker forwards them to subscribers right away.
+Each subscriber keeps its own copy of the state, built from one snapshot at
+subscribe time plus the change events after it, so nothing is re-read or
+re-parsed while it is unchanged.
+
+Wire format is one JSON object per line:
+  client -> broker  {"op": "pub", "topic": t, "values": {key: value, ...}}
+                    {"op": "sub", "topics": [t, ...]}
+  broker -> client  {"op": "snapshot", "topic": t, "state": {...}, "version": n}
+                    {"op": "event", "topic": t, "changes": {...}, "version": n}
+
+Publishing a value that is already current is a no-op, so repeated "healthy"
+heartbeats don't wake anyone. The broker can mirror topics to JSON files,
+written atomically with write-then-rename, for tools that still read the files.
+
+Run the broker on its own with `python status_bus.py`. Alternatively,
+ensure_broker() starts one inside the calling process when none is reachable.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import socket
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+SOCKET_PATH = os.environ.get("STATUS_BUS_SOCKET", os.path.join(tempfile.gettempdir(), "mcp_status_bus.sock"))
+
+# topic -> file the broker keeps in sync (same layout the agents used to write)
+DEFAULT_MIRROR = {"status": "agent_status.json", "finance": "finance_data.json"}
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """Write JSON to a temp file in the same directory and rename it over `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+# ------------------------------------------------------------
+# Broker
+# ------------------------------------------------------------
+class Broker:
+    """Holds the latest state per topic and fans changes out to subscribers."""
+
+    def __init__(self, path: str = SOCKET_PATH, mirror: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.mirror = DEFAULT_MIRROR if mirror is None else mirror
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self.versions: Dict[str, int] = {}
+        self.subscribers: Dict[str, set] = {}
+
+    async def serve(self, ready: Optional[threading.Event] = None) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)  # stale socket from a previous run
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        topics: set = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                if msg.get("op") == "pub":
+                    await self._publish(msg["topic"], msg.get("values") or {})
+                elif msg.get("op") == "sub":
+                    for topic in msg.get("topics", []):
+                        topics.add(topic)
+                        self.subscribers.setdefault(topic, set()).add(writer)
+                        self._send(writer, {"op": "snapshot", "topic": topic,
+                                            "state": self.state.get(topic, {}),
+                                            "version": self.versions.get(topic, 0)})
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for topic in topics:
+                self.subscribers.get(topic, set()).discard(writer)
+            writer.close()
+
+    async def _publish(self, topic: str, values: Dict[str, Any]) -> None:
+        current = self.state.setdefault(topic, {})
+        changes = {k: v for k, v in values.items() if current.get(k, object()) != v}
+        if not changes:
+            return
+        current.update(changes)
+        self.versions[topic] = self.versions.get(topic, 0) + 1
+        event = {"op": "event", "topic": topic, "changes": changes, "version": self.versions[topic]}
+        for writer in list(self.subscribers.get(topic, ())):
+            self._send(writer, event)
+        if topic in self.mirror:
+            write_json_atomic(self.mirror[topic], current)
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, msg: dict) -> None:
+        if not writer.is_closing():
+            writer.write((json.dumps(msg) + "\n").encode())
+
+
+def _broker_reachable(path: str) -> bool:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def ensure_broker(path: str = SOCKET_PATH, mirror: Optional[Dict[str, str]] = None) -> bool:
+    """
+    Make sure a broker is listening on `path`, starting one on a daemon thread in
+    this process if needed. Returns True if this call started it.
+    """
+    if _broker_reachable(path):
+        return False
+    ready = threading.Event()
+    broker = Broker(path, mirror)
+    thread = threading.Thread(target=lambda: asyncio.run(broker.serve(ready)), daemon=True)
+    thread.start()
+    if not ready.wait(5.0):
+        raise RuntimeError(f"status bus broker did not start on {path}")
+    return True
+
+
+# ------------------------------------------------------------
+# Client
+# ------------------------------------------------------------
+class BusClient:
+    """
+    Blocking client for the status bus. `state` is updated by a reader thread
+    from events; `next_event()` lets a loop block until something changes.
+    """
+
+    def __init__(self, topics: Iterable[str] = (), path: str = SOCKET_PATH):
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self.versions: Dict[str, int] = {}
+        self._events: "queue.Queue[dict]" = queue.Queue()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._pending_snapshots = set(topics)
+        if self._pending_snapshots:
+            self._send({"op": "sub", "topics": sorted(self._pending_snapshots)})
+        else:
+            self._synced.set()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _send(self, msg: dict) -> None:
+        data = (json.dumps(msg) + "\n").encode()
+        with self._lock:
+            self._sock.sendall(data)
+
+    def _read_loop(self) -> None:
+        with self._sock.makefile("r") as stream:
+            for line in stream:
+                msg = json.loads(line)
+                topic = msg["topic"]
+                if msg["op"] == "snapshot":
+                    self.state[topic] = dict(msg["state"])
+                    self._pending_snapshots.discard(topic)
+                    if not self._pending_snapshots:
+                        self._synced.set()
+                else:
+                    self.state.setdefault(topic, {}).update(msg["changes"])
+                self.versions[topic] = msg["version"]
+                self._events.put(msg)
+        self._events.put({"op": "closed", "topic": None})
+
+    def wait_synced(self, timeout: Optional[float] = 5.0) -> bool:
+        """Block until the initial snapshots for all subscribed topics arrived."""
+        return self._synced.wait(timeout)
+
+    def publish(self, topic: str, key: Optional[str] = None, value: Any = None,
+                values: Optional[Dict[str, Any]] = None) -> None:
+        """Publish one key (`key`, `value`) or several at once (`values`)."""
+        payload = dict(values or {})
+        if key is not None:
+            payload[key] = value
+        self._send({"op": "pub", "topic": topic, "values": payload})
+
+    def get(self, topic: str, key: str, default: Any = None) -> Any:
+        return self.state.get(topic, {}).get(key, default)
+
+    def next_event(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next snapshot/event message, or None on timeout."""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+if __name__ == "__main__":
+    print(f"🚌 Status bus listening on {SOCKET_PATH}")
+    try:
+        asyncio.run(Broker().serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,103 @@
+"""
+user_index.py — secondary indexes for the data agents' user stores.
+
+Role lookups use an exact role -> ids map. Substring search over name/email
+uses character trigrams. Ids are allocated here too, so `ordered_ids` stays
+ascending for cursor pagination. The /call handlers are sync and run on
+FastAPI's threadpool. Writes (id allocation, store write, indexing) and the
+posting reads therefore happen under one lock. Searches copy what they need
+under the lock and verify candidates against the store outside it.
+"""
+
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Dict, List, Set
+
+NGRAM = 3  # substring search uses character trigrams over name/email
+
+
+def _ngrams(text: str) -> Set[str]:
+    # fields shorter than NGRAM are indexed whole so short terms can still find them
+    if len(text) < NGRAM:
+        return {text} if text else set()
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def _search_text(user: Dict[str, Any]) -> List[str]:
+    return [str(user.get("name", "")).lower(), str(user.get("email", "")).lower()]
+
+
+class UserIndex:
+    """Role and trigram indexes plus the id allocator over one id -> user store."""
+
+    def __init__(self, store: MutableMapping):
+        self.store = store
+        self.roles: Dict[str, Set[int]] = {}
+        self.ngrams: Dict[str, Set[int]] = {}
+        self.ordered_ids: List[int] = []  # ascending, append-only: safe to slice without the lock
+        self.next_id = 1
+        self._lock = threading.Lock()
+        self.rebuild()
+
+    def _add(self, user: Dict[str, Any]) -> None:
+        uid = user["id"]
+        self.ordered_ids.append(uid)  # ids are handed out in increasing order
+        role = user.get("role")
+        if role is not None:
+            self.roles.setdefault(role, set()).add(uid)
+        for field in _search_text(user):
+            for gram in _ngrams(field):
+                self.ngrams.setdefault(gram, set()).add(uid)
+
+    def rebuild(self) -> None:
+        with self._lock:
+            self.roles.clear()
+            self.ngrams.clear()
+            self.ordered_ids.clear()
+            for uid in sorted(self.store):
+                self._add(self.store[uid])
+            self.next_id = max(self.store.keys()) + 1 if self.store else 1
+
+    def insert(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Give `data` the next id, write it to the store and index it, as one step.
+        Raises ValueError, before anything is written, for a field that can't be indexed.
+        """
+        role = data.get("role")
+        if role is not None and not isinstance(role, str):
+            raise ValueError("role must be a string")
+        with self._lock:
+            data["id"] = self.next_id
+            self.store[self.next_id] = data
+            self.next_id += 1
+            self._add(data)
+        return data
+
+    def with_role(self, role: str) -> Set[int]:
+        with self._lock:
+            return set(self.roles.get(role, ()))
+
+    def matching(self, term: str) -> Set[int]:
+        """
+        Ids whose name or email contains `term`.
+        Terms of NGRAM characters or more intersect the n-gram postings (smallest
+        first) and verify the few candidates. A shorter term occurs in a field
+        exactly when it occurs in one of the field's n-grams, so it is answered
+        by unioning the postings of matching keys without touching records.
+        """
+        with self._lock:
+            if len(term) < NGRAM:
+                ids: Set[int] = set()
+                for gram, posting in self.ngrams.items():
+                    if term in gram:
+                        ids |= posting
+                return ids
+            postings = []
+            for gram in _ngrams(term):
+                ids = self.ngrams.get(gram)
+                if not ids:
+                    return set()
+                postings.append(ids)
+            postings.sort(key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        return {uid for uid in candidates if any(term in f for f in _search_text(self.store[uid]))}